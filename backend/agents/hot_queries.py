@@ -0,0 +1,192 @@
+"""
+Pre-registered answers for the most common procedure queries.
+
+A handful of procedures ("knee MRI", "chest CT", "wrist x-ray") make up most
+search traffic. Their phrasings are normalized once at import time so a single
+dict lookup answers them before any database, LLM, or web work. A few
+precompiled templates widen that fast path: price-question framing ("how much
+is a knee MRI?") is stripped before the lookup, and queries that name their
+codes outright ("CPT 73721", "99213") skip the lookup table entirely.
+Refresh HOT_QUERY_PHRASES from the query_logs table as traffic shifts, or point
+HOT_QUERIES_PATH at a JSON file of extra phrases to update them without a release.
+"""
+
+import json
+import logging
+import re
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+from agents.procedure_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+_CODE = r"(?:[0-9]{4}[0-9a-z]|[a-z][0-9]{4})"
+
+# Codes labelled as such anywhere in the query: "cpt 73721", "HCPCS code G0121"
+_LABELLED_CODE_RE = re.compile(rf"\b(?:cpt|hcpcs)(?:\s+code)?\s*#?\s*({_CODE})\b", re.IGNORECASE)
+
+# A query that is nothing but codes: "73721", "99213, 99214"
+_BARE_CODES_RE = re.compile(rf"\s*{_CODE}(?:[\s,]+{_CODE})*\s*", re.IGNORECASE)
+_BARE_CODE_RE = re.compile(_CODE, re.IGNORECASE)
+
+# Price-question framing around the procedure the user is asking about
+_PRICE_QUESTION_RE = re.compile(
+    r"\s*(?:how much (?:is|are|does|do|would|will|for)|what does|what is the (?:price|cost) (?:of|for)"
+    r"|(?:price|cost|pricing) (?:of|for))"
+    r"\s+(?:(?:a|an|the|my)\s+)?(?P<procedure>.+?)"
+    r"(?:\s+(?:cost|costs|price|prices|run|be))?\s*\??\s*",
+    re.IGNORECASE,
+)
+
+
+def explicit_cpt_codes(query: str) -> Tuple[str, ...]:
+    """Codes the query names outright, in order; empty if it describes a procedure instead"""
+    if _BARE_CODES_RE.fullmatch(query):
+        codes = _BARE_CODE_RE.findall(query)
+    else:
+        codes = _LABELLED_CODE_RE.findall(query)
+    return tuple(dict.fromkeys(code.upper() for code in codes))
+
+
+def strip_price_question(query: str) -> str:
+    """The procedure part of a price question ("how much is a knee MRI?" -> "knee MRI")"""
+    match = _PRICE_QUESTION_RE.fullmatch(query)
+    return match.group("procedure") if match else query
+
+
+def _stem(word: str) -> str:
+    """Strip a plural 's' so "x-rays" and "x-ray" normalize alike"""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_query(query: str) -> str:
+    """Order-insensitive key for a query: lowercased, stemmed, sorted words"""
+    return " ".join(sorted({_stem(word) for word in tokenize(query)}))
+
+
+# Common phrasings -> CPT codes, best match first
+HOT_QUERY_PHRASES: Dict[str, Tuple[str, ...]] = {
+    # Imaging - MRI
+    "knee mri": ("73721",),
+    "mri lower extremity": ("73721",),
+    "brain mri": ("70553",),
+    "head mri": ("70553",),
+    "lumbar spine mri": ("72148",),
+    "lower back mri": ("72148",),
+    "back mri": ("72148",),
+    "cervical spine mri": ("72141",),
+    "neck mri": ("72141",),
+    # Imaging - CT
+    "chest ct": ("71250", "71260"),
+    "ct chest with contrast": ("71260",),
+    "head ct": ("70450",),
+    "brain ct": ("70450",),
+    "ct abdomen pelvis": ("74177", "74176"),
+    "abdominal ct": ("74177", "74176"),
+    "cat scan chest": ("71250", "71260"),
+    # Imaging - X-ray
+    "chest x-ray": ("71046", "71045"),
+    "chest xray": ("71046", "71045"),
+    "wrist x-ray": ("73110",),
+    "wrist xray": ("73110",),
+    "knee x-ray": ("73560", "73562"),
+    "knee xray": ("73560", "73562"),
+    "shoulder x-ray": ("73030",),
+    "shoulder xray": ("73030",),
+    "ankle x-ray": ("73610",),
+    "ankle xray": ("73610",),
+    "foot x-ray": ("73630",),
+    "foot xray": ("73630",),
+    "lower back x-ray": ("72110",),
+    # Imaging - ultrasound and mammography
+    "abdominal ultrasound": ("76700",),
+    "pelvic ultrasound": ("76856",),
+    "transvaginal ultrasound": ("76830",),
+    "pregnancy ultrasound": ("76805",),
+    "obstetric ultrasound": ("76805",),
+    "echocardiogram": ("93306",),
+    "heart ultrasound": ("93306",),
+    "mammogram": ("77067",),
+    "screening mammogram": ("77067",),
+    # Laboratory
+    "blood test": ("85025", "80053"),
+    "cbc": ("85025",),
+    "complete blood count": ("85025",),
+    "metabolic panel": ("80053", "80048"),
+    "comprehensive metabolic panel": ("80053",),
+    "basic metabolic panel": ("80048",),
+    "cholesterol test": ("80061",),
+    "lipid panel": ("80061",),
+    "a1c": ("83036",),
+    "hemoglobin a1c": ("83036",),
+    "diabetes test": ("83036",),
+    "thyroid test": ("84443",),
+    "tsh": ("84443",),
+    "psa test": ("84153",),
+    "vitamin d test": ("82306",),
+    "urinalysis": ("81001",),
+    "urine test": ("81001",),
+    "urine culture": ("87086",),
+    "blood draw": ("36415",),
+    # Cardiology
+    "ekg": ("93000",),
+    "ecg": ("93000",),
+    "electrocardiogram": ("93000",),
+    # Office visits
+    "office visit": ("99213", "99214"),
+    "doctor visit": ("99213", "99214"),
+    "new patient visit": ("99203", "99204"),
+    # Procedures and surgery
+    "colonoscopy": ("45378",),
+    "knee replacement": ("27447",),
+    "total knee replacement": ("27447",),
+    "knee arthroscopy": ("29881",),
+    "meniscus surgery": ("29881",),
+    "cataract surgery": ("66984",),
+    "vaginal delivery": ("59400",),
+    "physical therapy": ("97110",),
+    "abscess drainage": ("10060",),
+    "flu shot": ("90471",),
+    "vaccine": ("90471",),
+}
+
+
+def build_hot_query_map(path: Optional[str] = None) -> Dict[str, Tuple[str, ...]]:
+    """
+    Normalized lookup table for HOT_QUERY_PHRASES.
+    
+    Args:
+        path: Optional JSON file of {"phrase": ["cpt_code", ...]} entries that add
+              to (or override) the built-in phrases. An unreadable file is ignored.
+    """
+    phrases = dict(HOT_QUERY_PHRASES)
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                extra = {
+                    phrase: tuple(str(code) for code in codes)
+                    for phrase, codes in json.load(f).items()
+                }
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.warning("Ignoring hot query file %s: %s", path, e)
+        else:
+            phrases.update(extra)
+    
+    return {normalize_query(phrase): codes for phrase, codes in phrases.items()}
+
+
+_HOT_QUERY_MAP: Dict[str, Tuple[str, ...]] = build_hot_query_map(settings.HOT_QUERIES_PATH)
+
+
+def lookup_hot_query(query: str) -> Optional[Tuple[str, ...]]:
+    """CPT codes pre-registered for query, or None if it is not a hot query"""
+    codes = _HOT_QUERY_MAP.get(normalize_query(query))
+    if codes is None:
+        procedure = strip_price_question(query)
+        if procedure is not query:
+            codes = _HOT_QUERY_MAP.get(normalize_query(procedure))
+    return codes
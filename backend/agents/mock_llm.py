@@ -3,7 +3,7 @@ Mock LLM Client for testing without actual LLM API calls
 """
 
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 
 class MockLLMClient:
@@ -16,18 +16,28 @@ class MockLLMClient:
         """Initialize mock client"""
         self.call_count = 0
     
-    def complete(self, prompt: str, temperature: float = 0.1) -> str:
+    def complete(
+        self,
+        prompt: str,
+        temperature: float = 0.1,
+        response_format: Optional[Dict] = None,
+        system: Optional[str] = None
+    ) -> str:
         """
         Mock completion that returns reasonable responses
         
         Args:
             prompt: The prompt text
             temperature: Temperature parameter (ignored in mock)
+            response_format: Structured-output schema (ignored in mock)
+            system: System prompt, read together with the prompt
             
         Returns:
             Mocked response string
         """
         self.call_count += 1
+        if system:
+            prompt = f"{system}\n\n{prompt}"
         
         # Detect what type of request this is
         if "hospital price transparency file" in prompt and "map" in prompt.lower():
@@ -5,12 +5,70 @@ Uses OpenRouter API to access multiple LLM providers
 
 import os
 import json
+import asyncio
 import logging
-from typing import Optional
+import threading
+import weakref
+from typing import AsyncIterator, Dict, Iterator, Optional
 import requests
 
 logger = logging.getLogger(__name__)
 
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Seconds an API request may wait on the connection or any single read
+REQUEST_TIMEOUT = 30
+
+# Async HTTP clients shared by every OpenRouterLLMClient, one per event loop: the
+# connections (multiplexed over HTTP/2 when h2 is installed) stay open between calls
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _shared_async_client() -> "httpx.AsyncClient":
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+    return client
+
+
+async def close_async_clients() -> None:
+    """Close the running loop's shared async HTTP client (call on app shutdown)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _stream_delta(data: str) -> Optional[str]:
+    """
+    Text carried by one server-sent chunk event, or None if it has none.
+    
+    Raises ValueError for an error event or a body that isn't JSON.
+    """
+    event = json.loads(data)
+    if "error" in event:
+        raise ValueError(f"OpenRouter stream error: {event['error']}")
+    choices = event.get("choices")
+    if not choices:
+        return None
+    return choices[0].get("delta", {}).get("content") or None
+
+# Models whose providers need a cache_control breakpoint to reuse a prompt prefix
+_CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+
 
 class OpenRouterLLMClient:
     """
@@ -18,10 +76,18 @@ class OpenRouterLLMClient:
     Provides access to multiple LLM providers through a single API
     """
     
+    # complete() has a streaming counterpart, stream()
+    supports_streaming = True
+    # Both also have awaitable forms, complete_async() and stream_async()
+    supports_async = HTTPX_AVAILABLE
+    # All four take a timeout, applied to the HTTP request itself
+    supports_timeout = True
+    
     def __init__(
         self, 
         api_key: Optional[str] = None, 
-        model: str = "anthropic/claude-3.5-sonnet"
+        model: str = "anthropic/claude-3.5-sonnet",
+        http_client: Optional["httpx.AsyncClient"] = None
     ):
         """
         Initialize OpenRouter client
@@ -32,11 +98,16 @@ class OpenRouterLLMClient:
                 - anthropic/claude-3.5-sonnet (recommended - best reasoning)
                 - openai/gpt-4-turbo (excellent alternative)
                 - google/gemini-pro-1.5 (good for structured tasks)
+            http_client: Async HTTP client for the *_async methods; defaults to
+                one shared per event loop
         """
         self.api_key = api_key or os.getenv('OPENROUTER_API_KEY')
         self.model = model
         self.base_url = "https://openrouter.ai/api/v1"
         self.call_count = 0
+        # One HTTP session per thread: calls reuse the open TLS connection
+        self._local = threading.local()
+        self._http_client = http_client
         
         if not self.api_key:
             logger.warning("No OpenRouter API key found. Using mock mode.")
@@ -49,7 +120,10 @@ class OpenRouterLLMClient:
         self, 
         prompt: str, 
         temperature: float = 0.1, 
-        max_tokens: int = 1024
+        max_tokens: int = 1024,
+        response_format: Optional[Dict] = None,
+        system: Optional[str] = None,
+        timeout: Optional[float] = None
     ) -> str:
         """
         Get completion from OpenRouter
@@ -58,6 +132,12 @@ class OpenRouterLLMClient:
             prompt: The prompt text
             temperature: Sampling temperature (0-1)
             max_tokens: Maximum tokens to generate
+            response_format: OpenAI-style response_format (e.g. a json_schema)
+                to constrain the output to valid JSON
+            system: Optional system prompt. Keep it identical across calls so the
+                provider can serve it from its prompt cache.
+            timeout: Seconds to wait on the connection and each read
+                (default REQUEST_TIMEOUT)
             
         Returns:
             Response string
@@ -66,33 +146,14 @@ class OpenRouterLLMClient:
         
         if self.mock_mode:
             logger.warning("Running in mock mode - using fallback responses")
-            return self._mock_response(prompt)
+            return self._mock_response(prompt, system)
         
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "HTTP-Referer": "https://github.com/healthcare-transparency",
-                "X-Title": "Healthcare Price Transparency Parser",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
-            
-            response = requests.post(
+            response = self._session().post(
                 f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
+                headers=self._headers(),
+                json=self._payload(prompt, temperature, max_tokens, response_format, system),
+                timeout=REQUEST_TIMEOUT if timeout is None else timeout
             )
             
             response.raise_for_status()
@@ -111,16 +172,227 @@ class OpenRouterLLMClient:
             if hasattr(e.response, 'text'):
                 logger.error(f"Response: {e.response.text}")
             logger.warning("Falling back to heuristic response")
-            return self._mock_response(prompt)
+            return self._mock_response(prompt, system)
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             logger.warning("Falling back to heuristic response")
-            return self._mock_response(prompt)
+            return self._mock_response(prompt, system)
+    
+    def stream(
+        self, 
+        prompt: str, 
+        temperature: float = 0.1, 
+        max_tokens: int = 1024,
+        response_format: Optional[Dict] = None,
+        system: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        """
+        Stream a completion from OpenRouter as text chunks
+        
+        Closing the generator early closes the HTTP connection, which stops
+        generation (and billing) for the remaining tokens. A request that fails
+        before any text arrives falls back to the heuristic response; one that
+        fails mid-stream raises, so partial text is never mixed with it.
+        
+        Args:
+            prompt: The prompt text
+            temperature: Sampling temperature (0-1)
+            max_tokens: Maximum tokens to generate
+            response_format: OpenAI-style response_format, as for complete()
+            system: Optional system prompt, as for complete()
+            timeout: Seconds to wait on the connection and each read, as for
+                complete(); a slow stream is bounded by the caller
+            
+        Yields:
+            Response text chunks
+        """
+        self.call_count += 1
+        
+        if self.mock_mode:
+            logger.warning("Running in mock mode - using fallback responses")
+            yield self._mock_response(prompt, system)
+            return
+        
+        payload = self._payload(prompt, temperature, max_tokens, response_format, system)
+        payload["stream"] = True
+        streamed = False
+        
+        try:
+            with self._session().post(
+                f"{self.base_url}/chat/completions",
+                headers=self._headers(),
+                json=payload,
+                stream=True,
+                timeout=REQUEST_TIMEOUT if timeout is None else timeout
+            ) as response:
+                response.raise_for_status()
+                
+                # Server-sent events: "data: {json}" lines, ending with "data: [DONE]"
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data: "):
+                        continue
+                    data = line[len("data: "):]
+                    if data == "[DONE]":
+                        break
+                    
+                    content = _stream_delta(data)
+                    if content:
+                        streamed = True
+                        yield content
+                        
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"OpenRouter API error: {e}")
+            if streamed:
+                raise
+            logger.warning("Falling back to heuristic response")
+            yield self._mock_response(prompt, system)
+    
+    async def complete_async(
+        self, 
+        prompt: str, 
+        temperature: float = 0.1, 
+        max_tokens: int = 1024,
+        response_format: Optional[Dict] = None,
+        system: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> str:
+        """
+        Awaitable complete(): the request runs on the event loop over a pooled
+        connection instead of occupying a worker thread.
+        """
+        self.call_count += 1
+        
+        if self.mock_mode:
+            logger.warning("Running in mock mode - using fallback responses")
+            return self._mock_response(prompt, system)
+        
+        try:
+            response = await self._async_http().post(
+                f"{self.base_url}/chat/completions",
+                headers=self._headers(),
+                json=self._payload(prompt, temperature, max_tokens, response_format, system),
+                timeout=httpx.USE_CLIENT_DEFAULT if timeout is None else timeout,
+            )
+            response.raise_for_status()
+            result = response.json()
+            return result['choices'][0]['message']['content']
+            
+        except httpx.HTTPError as e:
+            logger.error(f"OpenRouter API error: {e}")
+            logger.warning("Falling back to heuristic response")
+            return self._mock_response(prompt, system)
+    
+    async def stream_async(
+        self, 
+        prompt: str, 
+        temperature: float = 0.1, 
+        max_tokens: int = 1024,
+        response_format: Optional[Dict] = None,
+        system: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Awaitable stream(). Closing the generator early (aclose()) ends the
+        response, which stops generation for the remaining tokens. Failures
+        fall back or raise as in stream().
+        """
+        self.call_count += 1
+        
+        if self.mock_mode:
+            logger.warning("Running in mock mode - using fallback responses")
+            yield self._mock_response(prompt, system)
+            return
+        
+        payload = self._payload(prompt, temperature, max_tokens, response_format, system)
+        payload["stream"] = True
+        streamed = False
+        
+        try:
+            async with self._async_http().stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                headers=self._headers(),
+                json=payload,
+                timeout=httpx.USE_CLIENT_DEFAULT if timeout is None else timeout,
+            ) as response:
+                response.raise_for_status()
+                
+                # Server-sent events, as in stream()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[len("data: "):]
+                    if data == "[DONE]":
+                        break
+                    
+                    content = _stream_delta(data)
+                    if content:
+                        streamed = True
+                        yield content
+                        
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"OpenRouter API error: {e}")
+            if streamed:
+                raise
+            logger.warning("Falling back to heuristic response")
+            yield self._mock_response(prompt, system)
+    
+    def _async_http(self) -> "httpx.AsyncClient":
+        return self._http_client if self._http_client is not None else _shared_async_client()
+    
+    def _session(self) -> requests.Session:
+        """This thread's HTTP session, created on first use"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+    
+    def _headers(self) -> Dict[str, str]:
+        """Request headers for the chat completions endpoint"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://github.com/healthcare-transparency",
+            "X-Title": "Healthcare Price Transparency Parser",
+            "Content-Type": "application/json"
+        }
+    
+    def _payload(
+        self,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        response_format: Optional[Dict],
+        system: Optional[str] = None
+    ) -> Dict:
+        """Chat completions request body"""
+        messages = []
+        if system:
+            # The system prompt is the prefix every request shares. Anthropic and
+            # Gemini only cache up to an explicit breakpoint; other providers cache
+            # repeated prefixes automatically.
+            block = {"type": "text", "text": system}
+            if self.model.startswith(_CACHE_CONTROL_MODEL_PREFIXES):
+                block["cache_control"] = {"type": "ephemeral"}
+            messages.append({"role": "system", "content": [block]})
+        messages.append({"role": "user", "content": prompt})
+        
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if response_format:
+            payload["response_format"] = response_format
+            # Only route to providers that actually enforce the schema
+            payload["provider"] = {"require_parameters": True}
+        return payload
     
-    def _mock_response(self, prompt: str) -> str:
+    def _mock_response(self, prompt: str, system: Optional[str] = None) -> str:
         """Fallback responses when API unavailable"""
         from .mock_llm import MockLLMClient
-        return MockLLMClient().complete(prompt)
+        return MockLLMClient().complete(prompt, system=system)
     
     def get_available_models(self) -> list:
         """
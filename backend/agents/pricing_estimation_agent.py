@@ -5,10 +5,13 @@ Pricing Estimation Agent - Intelligent medical bill estimation using web search
 import os
 import json
 import re
+import threading
 from typing import List, Dict, Optional, Tuple
 from datetime import date, datetime
 import logging
 
+from cachetools import TTLCache
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -36,6 +39,11 @@ class PricingEstimationAgent:
     - Falls back gracefully when data is unavailable
     """
     
+    # Web-derived estimates by request inputs: each costs a web search plus an
+    # LLM call, and published prices change slowly
+    _estimate_cache = TTLCache(maxsize=2048, ttl=3600)
+    _estimate_lock = threading.Lock()
+    
     def __init__(
         self, 
         llm_client=None,
@@ -124,6 +132,20 @@ class PricingEstimationAgent:
                 "analysis": str (if LLM used)
             }
         """
+        use_llm_analysis = bool(use_llm_analysis and self.llm)
+        cache_key = (
+            cpt_code,
+            procedure_description,
+            (state or "").upper(),
+            (city or "").strip().lower(),
+            (payer_name or "").strip().lower(),
+            use_llm_analysis,
+        )
+        with self._estimate_lock:
+            cached = self._estimate_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+        
         logger.info(f"Estimating price for CPT {cpt_code} in {city}, {state}")
         
         # Step 1: Perform web search
@@ -148,7 +170,7 @@ class PricingEstimationAgent:
         base_estimate = self._aggregate_pricing_data(extracted_prices, len(search_results))
         
         # Step 4: Use LLM for intelligent analysis if available and requested
-        if use_llm_analysis and self.llm:
+        if use_llm_analysis:
             llm_enhanced = self._llm_analysis(
                 cpt_code=cpt_code,
                 procedure_description=procedure_description,
@@ -167,6 +189,10 @@ class PricingEstimationAgent:
         
         logger.info(f"Price estimated: ${base_estimate['negotiated_rate']:.2f} (confidence: {base_estimate['confidence']:.2f})")
         
+        # Fallback estimates above aren't cached, so a failed search is retried next time
+        with self._estimate_lock:
+            self._estimate_cache[cache_key] = dict(base_estimate)
+        
         return base_estimate
     
     def _perform_web_search(
@@ -290,31 +316,27 @@ class PricingEstimationAgent:
         if not prices:
             return 0.0
         
-        # Base confidence from sample size (0.3 to 0.75)
-        source_confidence = min(0.75, 0.3 + (source_count / 25))
+        n = len(prices)
         
-        # Confidence from number of prices
-        price_count_confidence = min(0.8, 0.3 + (len(prices) / 30))
+        # Base confidence from sample size (0.3 to 0.75), plus confidence from number of prices
+        base_confidence = min(0.75, 0.3 + source_count / 25) + min(0.8, 0.3 + n / 30)
         
-        # Reduce confidence for high variance
-        if len(prices) > 1:
-            mean = sum(prices) / len(prices)
-            variance = sum((p - mean) ** 2 for p in prices) / len(prices)
-            std_dev = variance ** 0.5
-            coefficient_of_variation = std_dev / mean if mean > 0 else 0
-            
-            # High variance reduces confidence
-            if coefficient_of_variation > 0.5:
-                variance_penalty = 0.7
-            elif coefficient_of_variation > 0.3:
-                variance_penalty = 0.85
-            else:
-                variance_penalty = 1.0
+        # Reduce confidence for high variance; a single data point is less reliable
+        if n > 1:
+            mean = sum(prices) / n
+            coefficient_of_variation = (
+                (sum((p - mean) ** 2 for p in prices) / n) ** 0.5 / mean if mean > 0 else 0
+            )
+            variance_penalty = (
+                0.7 if coefficient_of_variation > 0.5
+                else 0.85 if coefficient_of_variation > 0.3
+                else 1.0
+            )
         else:
-            variance_penalty = 0.8  # Single data point is less reliable
+            variance_penalty = 0.8
         
         # Combined confidence
-        final_confidence = (source_confidence + price_count_confidence) / 2 * variance_penalty
+        final_confidence = base_confidence / 2 * variance_penalty
         
         return max(0.25, min(0.85, final_confidence))  # Clamp between 0.25 and 0.85
     
@@ -0,0 +1,191 @@
+"""
+In-memory word index over procedure descriptions.
+
+Built once per database engine and reused across requests, so paraphrased
+or reordered queries ("knee MRI" vs "MRI, knee joint") resolve with a few array
+operations instead of a LIKE scan followed by an LLM round-trip.
+"""
+
+import heapq
+import re
+import sys
+import threading
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database.schema import Procedure
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Words too common in CPT descriptions to say anything about the procedure
+_STOPWORDS = frozenset({"a", "an", "and", "for", "in", "of", "on", "or", "the", "to", "with"})
+
+
+def words(text: str) -> List[str]:
+    """Lowercased alphanumeric words of text in order, minus stopwords"""
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    """Lowercased alphanumeric words of text, minus stopwords"""
+    return frozenset(words(text))
+
+
+def _phrase_key(word_list: List[str]) -> str:
+    """Space-delimited on both sides so automaton hits fall on word boundaries"""
+    return f" {' '.join(word_list)} "
+
+
+@dataclass(frozen=True)
+class ProcedureRecord:
+    """Detached copy of a procedure row, safe to share between sessions"""
+
+    cpt_code: str
+    description: str
+    category: Optional[str]
+    medicare_rate: Optional[float]
+
+
+class ProcedureIndex:
+    """
+    Inverted index mapping description words to procedures.
+    """
+
+    def __init__(self, records: Iterable[ProcedureRecord]):
+        self._records: List[ProcedureRecord] = []
+        self._by_code: Dict[str, ProcedureRecord] = {}
+        postings: Dict[str, List[int]] = defaultdict(list)
+
+        for record in records:
+            row = len(self._records)
+            self._records.append(record)
+            self._by_code[record.cpt_code] = record
+            for word in tokenize(record.description):
+                postings[word].append(row)
+
+        # Row ids as int32 arrays so scoring runs inside NumPy rather than per row in Python
+        self._postings: Dict[str, np.ndarray] = {
+            word: np.asarray(rows, dtype=np.int32) for word, rows in postings.items()
+        }
+        
+        # Aho-Corasick automaton over whole descriptions: one pass over a query
+        # finds every description it contains, however large the table
+        self._phrases = None
+        if AHOCORASICK_AVAILABLE:
+            phrase_rows: Dict[str, List[int]] = defaultdict(list)
+            for row, record in enumerate(self._records):
+                description_words = words(record.description)
+                if description_words:
+                    phrase_rows[_phrase_key(description_words)].append(row)
+            
+            self._phrases = ahocorasick.Automaton()
+            for phrase, rows in phrase_rows.items():
+                self._phrases.add_word(phrase, (len(phrase), rows))
+            if phrase_rows:
+                self._phrases.make_automaton()
+            else:
+                self._phrases = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, cpt_code: str) -> Optional[ProcedureRecord]:
+        """Record for a CPT code, or None if it is not in the index"""
+        return self._by_code.get(cpt_code)
+
+    def phrase_search(self, query: str, limit: int) -> List[ProcedureRecord]:
+        """
+        Procedures whose entire description appears, word for word, in the query
+        (e.g. "Colonoscopy" in "how much is a colonoscopy"), longest first.
+        
+        Returns [] when pyahocorasick isn't installed.
+        """
+        if self._phrases is None or limit <= 0:
+            return []
+        
+        hits = {}
+        for _, (length, rows) in self._phrases.iter(_phrase_key(words(query))):
+            for row in rows:
+                hits[row] = length
+        
+        top = heapq.nsmallest(limit, hits, key=lambda row: (-hits[row], row))
+        return [self._records[row] for row in top]
+    
+    def search(self, query: str, limit: int) -> List[Tuple[ProcedureRecord, float]]:
+        """
+        Rank procedures by the fraction of query words in their description.
+
+        Returns:
+            Up to limit (record, score) pairs, best first
+        """
+        query_words = tokenize(query)
+        postings = [self._postings[word] for word in query_words if word in self._postings]
+        if not postings or limit <= 0:
+            return []
+
+        # Query-word hits per matching row: the sparse bag-of-words product. Work is
+        # proportional to the postings touched, not to the size of the table.
+        rows, hits = np.unique(np.concatenate(postings), return_counts=True)
+
+        # Rank by hits, then row order, folded into one integer key so the partial
+        # selection is deterministic even when ties straddle the k-th place
+        key = hits.astype(np.int64) * len(self._records) - rows
+        k = min(limit, len(rows))
+        top = np.argpartition(-key, k - 1)[:k]
+        top = top[np.argsort(-key[top])]
+
+        total = len(query_words)
+        return [(self._records[rows[i]], float(hits[i]) / total) for i in top]
+
+
+_indexes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_procedure_index(db: Session) -> ProcedureIndex:
+    """Return the index for the session's engine, building it on first use"""
+    bind = db.get_bind()
+
+    with _indexes_lock:
+        index = _indexes.get(bind)
+        if index is None:
+            rows = db.query(
+                Procedure.cpt_code,
+                Procedure.description,
+                Procedure.category,
+                Procedure.medicare_rate,
+            ).all()
+            index = ProcedureIndex(
+                ProcedureRecord(
+                    cpt_code=sys.intern(cpt_code),
+                    description=description,
+                    category=category,
+                    medicare_rate=float(medicare_rate) if medicare_rate is not None else None,
+                )
+                for cpt_code, description, category, medicare_rate in rows
+            )
+            _indexes[bind] = index
+
+    return index
+
+
+def invalidate_procedure_indexes(*_args) -> None:
+    """Drop every built index; the next lookup rebuilds from the database"""
+    with _indexes_lock:
+        _indexes.clear()
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Procedure, _event_name, invalidate_procedure_indexes)
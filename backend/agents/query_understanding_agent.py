@@ -2,11 +2,29 @@
 Query Understanding Agent - Real-time natural language to CPT code mapping
 """
 
+import asyncio
+import heapq
 import json
+import logging
 import re
-from typing import List, Dict, Tuple, Optional
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
+from anyio import CapacityLimiter, to_thread
+from cachetools import TTLCache
+from typing import Any, AsyncIterator, List, Dict, Tuple, Optional, FrozenSet, Iterable, NamedTuple
+from sqlalchemy import Float, String, event, literal, text
 from sqlalchemy.orm import Session
-from database.schema import Procedure
+from app.config import settings
+from database.schema import Procedure, has_table
+from agents.procedure_index import get_procedure_index, tokenize, words
+from agents.hot_queries import explicit_cpt_codes, lookup_hot_query, normalize_query
+
+logger = logging.getLogger(__name__)
 
 try:
     from app.services.duckduckgo_search_client import DuckDuckGoSearchClient
@@ -14,6 +32,510 @@ try:
 except ImportError:
     DUCKDUCKGO_AVAILABLE = False
 
+try:
+    import orjson
+    _json_loads = orjson.loads  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    from rapidfuzz import fuzz, process, utils as fuzz_utils
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+# The only procedure columns a search result needs. Selecting just these returns
+# plain rows and skips ORM identity-map work for every candidate.
+_RESULT_COLUMNS = (
+    Procedure.cpt_code,
+    Procedure.description,
+    Procedure.category,
+    Procedure.medicare_rate,
+)
+
+# Candidates from the FTS5 shadow table (see database.schema.PROCEDURE_FTS_DDL)
+_FTS_SEARCH_SQL = text(
+    "SELECT p.cpt_code, p.description, p.category, p.medicare_rate "
+    "FROM procedures_fts JOIN procedures AS p ON p.rowid = procedures_fts.rowid "
+    "WHERE procedures_fts MATCH :match ORDER BY procedures_fts.rank LIMIT :limit"
+)
+
+# LLM calls run on this pool so a stalled provider can be abandoned after a timeout
+_LLM_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="query-agent-llm")
+# 5-digit CPT codes in web search titles, snippets and URLs
+_CPT_RE = re.compile(r'\b\d{5}\b')
+
+# A code's web-search score comes from this many characters either side of it
+CPT_CONTEXT_CHARS = 50
+MIN_CONTEXT_SCORE = 0.5
+
+
+def _context_query(query: str) -> Any:
+    """Normalize the query once for scoring many CPT code mentions against it"""
+    if RAPIDFUZZ_AVAILABLE:
+        return fuzz_utils.default_process(query)
+    return query.lower().split()
+
+
+def _context_score(context_query: Any, context: str) -> float:
+    """How well the text around a CPT code mention matches _context_query(query) (0-1)"""
+    if RAPIDFUZZ_AVAILABLE:
+        return fuzz.partial_ratio(context_query, fuzz_utils.default_process(context)) / 100.0
+    
+    if not context_query:
+        return 0.0
+    context_lower = context.lower()
+    return sum(word in context_lower for word in context_query) / len(context_query)
+
+
+def _web_cache_key(user_query: str, limit: int) -> str:
+    """_query_cache key: the same query retyped with other case or spacing shares it"""
+    return f"{user_query.strip().lower()}:{limit}"
+
+
+class _TokenBucket:
+    """
+    Thread-safe token bucket: acquire() blocks until a request may be sent.
+    
+    One bucket is shared by every agent, so concurrent requests split the
+    budget instead of each sleeping through its own delays.
+    """
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Take a token, waiting for one to accrue if the bucket is empty"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Scraped Google searches; the consensus round's parallel searches may start together
+_GOOGLE_LIMITER = _TokenBucket(settings.GOOGLE_SEARCH_RATE_LIMIT, capacity=2)
+
+
+# Worker threads the async search may hold at once. Database steps get a budget
+# about the size of the connection pool; slow web searches get their own, so a
+# burst of web fallbacks can't starve the database steps of other requests.
+_DB_LIMITER = CapacityLimiter(20)
+_WEB_LIMITER = CapacityLimiter(10)
+
+
+# Raw search-engine responses, keyed by engine and search string. Sits below
+# _query_cache so differently-limited or differently-cased queries share a fetch.
+_SERP_CACHE = TTLCache(maxsize=1000, ttl=86400)
+_SERP_CACHE_LOCK = threading.Lock()
+
+
+def _cached_serp(key: Tuple[str, str], fetch):
+    """Return the cached response for key, calling fetch() on a miss (empty responses aren't cached)"""
+    with _SERP_CACHE_LOCK:
+        cached = _SERP_CACHE.get(key)
+    if cached is not None:
+        return cached
+    
+    response = fetch()
+    if response:
+        with _SERP_CACHE_LOCK:
+            _SERP_CACHE[key] = response
+    return response
+
+
+# One DDGS client per thread: reuses its HTTP connection pool across searches
+# without sharing a client between threads
+_DDGS_LOCAL = threading.local()
+
+
+def _ddgs_client():
+    """This thread's DDGS client, created on first use"""
+    from ddgs import DDGS
+    
+    # Remember which DDGS class built the client, so a reloaded module gets a fresh one
+    factory, client = getattr(_DDGS_LOCAL, "client", (None, None))
+    if factory is not DDGS:
+        client = DDGS()
+        _DDGS_LOCAL.client = (DDGS, client)
+    return client
+
+
+# Web searches started while the LLM runs, once the local tiers have missed
+_WEB_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-agent-web")
+LLM_MAX_ATTEMPTS = 2  # First call plus one retry
+LLM_RETRY_BACKOFF = 0.5  # Seconds, doubled per attempt
+VALIDATION_TIMEOUT = 2.0  # Seconds allowed for validating web-search CPT codes
+RESULT_CACHE_SIZE = 1024  # Database/index answers kept per engine
+RESULT_CACHE_TTL = 300  # Seconds; short, since these track the procedures table
+PROMPT_SAMPLE_SIZE = 30  # Procedures listed in the LLM search prompt
+PARAPHRASE_MATCH_CUTOFF = 92  # Min RapidFuzz ratio for a cached LLM answer to be reused
+PARAPHRASE_CANDIDATES = 5  # Nearest cached queries checked for matching qualifiers
+
+# Words that change which procedure a query names ("with" is a stopword, so
+# "with contrast" vs "without contrast" differs by "without" alone). A cached LLM
+# answer is only reused for a fuzzy match carrying exactly the same ones.
+_QUALIFIER_WORDS = frozenset({
+    "without", "wo", "no", "non", "not",
+    "left", "right", "lt", "rt", "bilateral", "unilateral",
+})
+
+
+class _DescFeatures(NamedTuple):
+    """Per-description scoring inputs, derived once per distinct text"""
+    lower: str
+    tokens: FrozenSet[str]
+    processed: str  # RapidFuzz-normalized form
+
+
+@lru_cache(maxsize=None)
+def _desc_features(description: str) -> _DescFeatures:
+    """Lowercase, tokenize and normalize a procedure description once, not once per query"""
+    lower = description.lower()
+    processed = fuzz_utils.default_process(description) if RAPIDFUZZ_AVAILABLE else lower
+    return _DescFeatures(lower, tokenize(lower), processed)
+
+
+def calculate_match_score(
+    query: str,
+    description: str,
+    query_tokens: Optional[FrozenSet[str]] = None
+) -> float:
+    """
+    Calculate similarity score between query and description.
+    
+    The score counts the query's words (as tokenize() splits them, so
+    "MRI-KNEE" has both) found in the description; an unrelated description
+    can't reach the match bar through shared letters. query_tokens
+    (tokenize(query)) may be passed in when scoring many descriptions
+    against the same query.
+    """
+    query_lower = query.lower()
+    desc = _desc_features(description)
+    desc_lower = desc.lower
+    
+    # Exact phrase match
+    if query_lower in desc_lower:
+        return 1.0
+    
+    # Word overlap
+    query_words = query_tokens if query_tokens is not None else tokenize(query)
+    desc_words = desc.tokens
+    
+    if not query_words:
+        return 0.0
+    
+    overlap = query_words & desc_words
+    score = len(overlap) / len(query_words)
+    
+    # Boost for word order matching
+    if all(word in desc_lower for word in query_words):
+        score += 0.2
+    
+    return min(1.0, score)
+
+
+def _match(row: Any, match_score: float) -> Dict:
+    """Result dict for a procedure row (ORM object, column row or index record)"""
+    return {
+        "cpt_code": row.cpt_code,
+        "description": row.description,
+        "category": row.category,
+        "medicare_rate": row.medicare_rate,
+        "match_score": match_score
+    }
+
+
+class _JsonValueScanner:
+    """
+    Accumulates streamed text until the first JSON object/array is closed.
+    
+    Tracks bracket depth (ignoring brackets inside strings) so the caller can
+    drop the stream as soon as the answer is complete instead of waiting for
+    trailing tokens.
+    """
+    
+    def __init__(self):
+        self._text: List[str] = []
+        self._depth = 0
+        self._started = self._in_string = self._escaped = False
+    
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk; True once the JSON value has closed"""
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                self._started = True
+            elif ch in "}]":
+                self._depth -= 1
+                if self._started and self._depth == 0:
+                    self._text.append(chunk[:i + 1])
+                    return True
+        self._text.append(chunk)
+        return False
+    
+    def text(self) -> str:
+        return "".join(self._text)
+
+
+def _read_json_value(chunks: Iterable[str], deadline: Optional[float] = None) -> str:
+    """
+    Consume streamed text only until the first JSON object/array is closed.
+    Returns everything read if the value never closes. Raises TimeoutError
+    once time.monotonic() passes deadline, however steadily chunks arrive.
+    """
+    scanner = _JsonValueScanner()
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("LLM stream did not finish before its deadline")
+    return scanner.text()
+
+
+async def _aread_json_value(chunks: AsyncIterator[str]) -> str:
+    """Async counterpart of _read_json_value"""
+    scanner = _JsonValueScanner()
+    async for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    return scanner.text()
+
+
+# Markdown fence that models ignoring response_format sometimes wrap their JSON in
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+def _loads_llm_json(response: str) -> Any:
+    """Parse an LLM's JSON answer, unwrapping a ```json fence if there is one"""
+    # Fast path: schema-constrained answers are bare JSON and skip the regex
+    if "```" in response:
+        fenced = _FENCE_RE.search(response)
+        if fenced:
+            response = fenced.group(1)
+    return _json_loads(response)
+
+
+# Structured-output schemas: the provider constrains decoding to these, so
+# responses parse with a plain JSON load and need no fence stripping
+CPT_CODES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "cpt_codes",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "cpt_codes": {
+                    "type": "array",
+                    "items": {"type": "string", "pattern": "^[0-9]{5}$"},
+                    "maxItems": 5
+                }
+            },
+            "required": ["cpt_codes"],
+            "additionalProperties": False
+        }
+    }
+}
+
+BATCH_CPT_CODES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "batch_cpt_codes",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "query": {"type": "integer"},
+                            "cpt_codes": {
+                                "type": "array",
+                                "items": {"type": "string", "pattern": "^[0-9]{5}$"},
+                                "maxItems": 5
+                            }
+                        },
+                        "required": ["query", "cpt_codes"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["results"],
+            "additionalProperties": False
+        }
+    }
+}
+
+VALIDATED_CPTS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "validated_cpt_codes",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "procedures": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "cpt_code": {"type": "string", "pattern": "^[0-9]{5}$"},
+                            "description": {"type": "string"}
+                        },
+                        "required": ["cpt_code", "description"],
+                        "additionalProperties": False
+                    },
+                    "maxItems": 3
+                }
+            },
+            "required": ["procedures"],
+            "additionalProperties": False
+        }
+    }
+}
+
+
+@lru_cache(maxsize=16)
+def _search_system_prompt(proc_context: str, batched: bool) -> str:
+    """
+    System prompt for CPT suggestions. Built once per procedure sample and kept
+    byte-identical across requests, so providers can serve it from their prompt cache.
+    """
+    if batched:
+        task = (
+            "Given several numbered user queries about medical procedures, find the most "
+            "relevant CPT codes from the database for each one."
+        )
+        output = (
+            "Task: For every query, return the CPT codes (up to 5) that best match it. Be precise.\n\n"
+            'Format: {"results": [{"query": 1, "cpt_codes": ["12345", "67890"]}, {"query": 2, "cpt_codes": ["11111"]}]}'
+        )
+    else:
+        task = (
+            "Given a user's natural language query about a medical procedure, find the most "
+            "relevant CPT codes from the database."
+        )
+        output = (
+            "Task: Return the CPT codes (up to 5) that best match this query. Be precise.\n\n"
+            'Format: {"cpt_codes": ["12345", "67890", "11111"]}'
+        )
+    
+    return f"""You are a medical coding assistant. {task}
+
+Sample procedures in database:
+{proc_context}
+
+{output}
+
+If unsure, return fewer codes rather than guessing.
+"""
+
+
+# Async searches that need the LLM within this window of each other share one call
+LLM_BATCH_MAX_SIZE = 8
+LLM_BATCH_MAX_WAIT = 0.02
+
+
+class _LLMBatch:
+    """CPT suggestion requests waiting to go out in one LLM call"""
+    
+    def __init__(self, agent: "QueryUnderstandingAgent", context: str):
+        self.agent = agent
+        self.context = context
+        self.queries: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class _LLMBatcher:
+    """
+    Coalesces CPT suggestion requests for one LLM client on one event loop.
+    
+    The first request opens a batch and starts a LLM_BATCH_MAX_WAIT timer.
+    Requests arriving before it fires join the batch, which goes out early once
+    it holds LLM_BATCH_MAX_SIZE queries, so no caller waits on an unbounded
+    queue. A batch of one is sent with the ordinary single-query prompt.
+    """
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        # Open batches keyed by prompt context, so each engine's queries batch apart
+        self._open: Dict[str, _LLMBatch] = {}
+        self._tasks: set = set()
+    
+    def submit(self, agent: "QueryUnderstandingAgent", query: str, context: str) -> asyncio.Future:
+        """Future for the CPT codes the LLM suggests for query"""
+        batch = self._open.get(context)
+        if batch is None:
+            batch = self._open[context] = _LLMBatch(agent, context)
+            batch.timer = self.loop.call_later(LLM_BATCH_MAX_WAIT, self._flush, batch)
+        
+        future = self.loop.create_future()
+        batch.queries.append(query)
+        batch.futures.append(future)
+        if len(batch.queries) >= LLM_BATCH_MAX_SIZE:
+            batch.timer.cancel()
+            self._flush(batch)
+        return future
+    
+    def _flush(self, batch: _LLMBatch) -> None:
+        if self._open.get(batch.context) is batch:
+            del self._open[batch.context]
+        
+        # Callers answered by the database in the meantime have cancelled their futures
+        pending = [(query, future) for query, future in zip(batch.queries, batch.futures) if not future.done()]
+        if pending:
+            task = self.loop.create_task(self._run(batch.agent, batch.context, pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    @staticmethod
+    async def _run(agent: "QueryUnderstandingAgent", context: str, pending: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            answers = await agent._suggest_codes([query for query, _ in pending], context)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), codes in zip(pending, answers):
+                if not future.done():
+                    future.set_result(codes)
+
+
+# One batcher per event loop and LLM client
+_llm_batchers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _llm_batcher(llm_client: Any) -> _LLMBatcher:
+    loop = asyncio.get_running_loop()
+    batchers = _llm_batchers.setdefault(loop, weakref.WeakKeyDictionary())
+    batcher = batchers.get(llm_client)
+    if batcher is None:
+        batcher = batchers[llm_client] = _LLMBatcher(loop)
+    return batcher
+
 
 class QueryUnderstandingAgent:
     """
@@ -21,13 +543,57 @@ class QueryUnderstandingAgent:
     using LLM + database search
     """
     
-    # Class-level cache for web search results (guarantees consistency)
-    _query_cache = {}
+    # Class-level cache for web search results (guarantees consistency within the TTL).
+    # Bounded so a long-running server doesn't grow it forever; shared across threads.
+    _query_cache = TTLCache(maxsize=10_000, ttl=3600)
+    _cache_lock = threading.Lock()
+    
+    # One lock per web search in flight, so duplicate requests wait instead of
+    # searching again; guarded by _cache_lock
+    _web_search_locks: Dict[str, threading.Lock] = {}
+    
+    # LLM CPT suggestions keyed by normalize_query(); guarded by _cache_lock
+    _llm_codes_cache = TTLCache(maxsize=5_000, ttl=3600)
+    
+    # LLM verdicts on web-search codes, keyed by (query, codes); guarded by _cache_lock
+    _validation_cache = TTLCache(maxsize=5_000, ttl=3600)
     
-    def __init__(self, llm_client, db_session: Session):
+    # Database/index answers keyed by (normalized query, limit), one TTLCache per
+    # engine; guarded by _cache_lock. Retyped and backspaced queries hit this.
+    _result_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+    
+    # Procedure sample for the LLM prompt, formatted once per engine
+    _prompt_context_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+    
+    def __init__(self, llm_client, db_session: Session, request_timeout: float = 8.0):
+        """
+        Args:
+            llm_client: Client exposing complete(prompt, temperature=...)
+            db_session: SQLAlchemy session for procedure lookups
+            request_timeout: Seconds to wait for a single LLM call before retrying
+        """
         self.llm = llm_client
         self.db = db_session
+        self.request_timeout = request_timeout
+        # Clients that can stream let us stop reading once the JSON answer closes
+        streaming = getattr(llm_client, "supports_streaming", False) is True
+        self._llm_call = self._stream_json if streaming else llm_client.complete
+        self._streaming = streaming
+        # Clients that take a timeout give up on the request themselves, which
+        # frees the worker thread an abandoned call would otherwise hold
+        self._llm_timeout = getattr(llm_client, "supports_timeout", False) is True
+        # Clients with awaitable calls run them on the event loop instead of a thread
+        self._llm_call_async = None
+        if getattr(llm_client, "supports_async", False) is True:
+            self._llm_call_async = self._stream_json_async if streaming else llm_client.complete_async
         
+    @classmethod
+    def cache_clear(cls) -> None:
+        """Forget everything derived from the procedures table"""
+        with cls._cache_lock:
+            cls._result_caches.clear()
+        cls._prompt_context_cache.clear()
+    
     def search_procedures(self, user_query: str, limit: int = 10) -> List[Dict]:
         """
         Main entry point: Search for procedures using natural language
@@ -48,42 +614,208 @@ class QueryUnderstandingAgent:
         """
         MIN_MATCH_SCORE = 0.5
         
+        # Step 0: Common queries are answered from the pre-registered map
+        hot_matches = self._hot_query_search(user_query, limit)
+        if hot_matches:
+            return hot_matches
+        
+        result_key = (user_query.strip().lower(), limit)
+        cached = self._cached_results(result_key)
+        if cached is not None:
+            return cached
+        
         # Step 1: Try database first (most consistent)
         db_matches = self._database_search(user_query, limit)
         good_db_matches = [m for m in db_matches if m["match_score"] >= MIN_MATCH_SCORE]
         
         # Step 2: If database has results, return them (deterministic)
         if good_db_matches:
-            return good_db_matches[:limit]
+            return self._store_results(result_key, good_db_matches[:limit])
         
-        # Step 3: Check cache for this query (ensures 100% consistency)
-        cache_key = f"{user_query.lower()}:{limit}"
-        if cache_key in self._query_cache:
-            print(f"Returning cached result for: {user_query}")
-            return self._query_cache[cache_key]
+        # Step 3: Word index catches reordered/paraphrased queries without going to the web
+        index_matches = self._index_search(user_query, limit)
+        if index_matches:
+            return self._store_results(result_key, index_matches)
         
-        # Step 4: Only use web search if database truly has NOTHING and not in cache
-        # Sort results by CPT code for consistency
-        web_results = []
-        if DUCKDUCKGO_AVAILABLE:
-            web_results = self._duckduckgo_search(user_query, limit)
+        # Steps 4-5: cached web search
+        return self._cached_web_search(user_query, limit)
+    
+    async def search_procedures_async(self, user_query: str, limit: int = 10) -> List[Dict]:
+        """
+        Async variant of search_procedures that overlaps the database search
+        with the LLM call.
         
-        if not web_results:
-            # Final fallback to Google
-            web_results = self._google_search(user_query, limit)
+        The LLM request is dispatched to a worker thread before the database
+        search starts, so DB latency is hidden under LLM latency. Strong DB
+        matches still win and the LLM answer is discarded; otherwise the LLM
+        suggestions are used, and web search remains the last resort.
         
-        if web_results:
-            # Sort by CPT code for consistent ordering
-            web_results.sort(key=lambda x: x["cpt_code"])
-            result = web_results[:limit]
-            # Cache result for future queries
-            self._query_cache[cache_key] = result
-            print(f"Caching new result for: {user_query}")
-            return result
+        Args:
+            user_query: Natural language query (e.g., "knee MRI", "x-ray chest")
+            limit: Max results to return
+            
+        Returns:
+            List of dicts with cpt_code, description, match_score
+        """
+        MIN_MATCH_SCORE = 0.5
+        
+        # Steps that may touch the database run on worker threads: building the word
+        # index or the prompt sample would otherwise stall every request on the loop.
+        # The limiters cap how many threads concurrent searches hold between them.
+        # Common queries still skip the LLM and database search entirely.
+        hot_matches = await to_thread.run_sync(self._hot_query_search, user_query, limit, limiter=_DB_LIMITER)
+        if hot_matches:
+            return hot_matches
+        
+        result_key = (user_query.strip().lower(), limit)
+        cached = self._cached_results(result_key)
+        if cached is not None:
+            return cached
+        
+        # Paraphrases of an earlier query reuse its LLM answer instead of calling again.
+        # The fuzzy lookup is CPU work over the whole cache, so it stays off the loop.
+        cpt_codes = await to_thread.run_sync(self._cached_llm_codes, user_query)
+        llm_task = None
+        if cpt_codes is None:
+            # The prompt needs the DB sample, so fetch it before handing off the LLM call.
+            # Concurrent searches that reach this point together share one LLM call.
+            context = await to_thread.run_sync(self._prompt_context, limiter=_DB_LIMITER)
+            llm_task = asyncio.create_task(self._batched_llm_codes(user_query, context))
+        
+        db_matches = await to_thread.run_sync(self._database_search, user_query, limit, limiter=_DB_LIMITER)
+        good_db_matches = [m for m in db_matches if m["match_score"] >= MIN_MATCH_SCORE]
+        
+        if good_db_matches:
+            if llm_task:
+                llm_task.cancel()
+            return self._store_results(result_key, good_db_matches[:limit])
+        
+        # The word index answers most paraphrases; the LLM is the last resort before the web
+        index_matches = await to_thread.run_sync(self._index_search, user_query, limit, limiter=_DB_LIMITER)
+        if index_matches:
+            if llm_task:
+                llm_task.cancel()
+            return self._store_results(result_key, index_matches)
+        
+        # Both local tiers missed, so the web is likely needed: start its fetch
+        # now to overlap the LLM wait, but not before (a running fetch can't be cancelled)
+        ddg_future = self._prefetch_duckduckgo(user_query, limit)
+        
+        try:
+            if llm_task is not None:
+                cpt_codes = await llm_task
+                self._store_llm_codes(user_query, cpt_codes)
+            # The IN query runs beside the loop like the other database steps
+            llm_matches = await to_thread.run_sync(
+                self._resolve_cpt_codes, cpt_codes, 0.8, limiter=_DB_LIMITER
+            )
+        except Exception as e:
+            logger.warning("LLM search error: %s", e)
+            llm_matches = []
+        
+        if llm_matches:
+            if ddg_future:
+                ddg_future.cancel()
+            return llm_matches[:limit]
+        
+        return await to_thread.run_sync(
+            self._cached_web_search, user_query, limit, ddg_future, limiter=_WEB_LIMITER
+        )
+    
+    def _cached_results(self, key: Tuple[str, int]) -> Optional[List[Dict]]:
+        """Database/index answer from the result cache, or None"""
+        with self._cache_lock:
+            cache = self._result_caches.get(self.db.get_bind())
+            return cache.get(key) if cache is not None else None
+    
+    def _store_results(self, key: Tuple[str, int], results: List[Dict]) -> List[Dict]:
+        """
+        Remember a database/index answer and return it.
+        
+        LLM and web answers are not stored here: they have their own caches,
+        and a later query that hits the database should not be shadowed by them.
+        """
+        bind = self.db.get_bind()
+        with self._cache_lock:
+            cache = self._result_caches.get(bind)
+            if cache is None:
+                cache = self._result_caches[bind] = TTLCache(
+                    maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL
+                )
+            cache[key] = results
+        return results
+    
+    def _prefetch_duckduckgo(self, user_query: str, limit: int) -> Optional[Future]:
+        """
+        Start the DuckDuckGo fetch in the background, unless its answer is cached.
+        
+        Call only once the database and word index have missed: the request
+        goes out as soon as a worker picks it up and can't be recalled.
+        
+        Only the network half runs off-thread; resolving codes against the
+        database stays on the caller's thread, since the session isn't thread-safe.
+        """
+        if not DUCKDUCKGO_AVAILABLE:
+            return None
+        with self._cache_lock:
+            if _web_cache_key(user_query, limit) in self._query_cache:
+                return None
+        return _WEB_EXECUTOR.submit(self._duckduckgo_fetch, user_query)
+    
+    def _cached_web_search(
+        self,
+        user_query: str,
+        limit: int,
+        ddg_future: Optional[Future] = None
+    ) -> List[Dict]:
+        """
+        Web search (DuckDuckGo, then Google) memoized per query and limit.
+        
+        Empty answers are cached too, so an unknown query only goes to the web
+        once per TTL. Concurrent requests for the same uncached query share one
+        search: the first runs it while the others wait on its lock and then
+        read the cache, instead of all hitting the search engines at once.
+        """
+        cache_key = _web_cache_key(user_query, limit)
+        with self._cache_lock:
+            cached = self._query_cache.get(cache_key)
+            if cached is None:
+                key_lock = self._web_search_locks.setdefault(cache_key, threading.Lock())
+        
+        if cached is None:
+            with key_lock:
+                try:
+                    # Whoever held the lock before us may have just answered it
+                    with self._cache_lock:
+                        cached = self._query_cache.get(cache_key)
+                    if cached is None:
+                        return self._uncached_web_search(user_query, limit, cache_key, ddg_future)
+                finally:
+                    with self._cache_lock:
+                        if self._web_search_locks.get(cache_key) is key_lock:
+                            del self._web_search_locks[cache_key]
         
-        # No results found anywhere - cache empty result too
-        self._query_cache[cache_key] = []
-        return []
+        if ddg_future:
+            ddg_future.cancel()
+        logger.debug("Returning cached result for: %s", user_query)
+        return cached
+    
+    def _uncached_web_search(
+        self,
+        user_query: str,
+        limit: int,
+        cache_key: str,
+        ddg_future: Optional[Future]
+    ) -> List[Dict]:
+        """Run the web fallback and cache whatever it finds, including nothing"""
+        web_results = self._web_search_fallback(user_query, limit, ddg_future)
+        
+        # Order by CPT code for consistency; partial selection since only `limit` are kept
+        result = heapq.nsmallest(limit, web_results, key=itemgetter("cpt_code"))
+        with self._cache_lock:
+            self._query_cache[cache_key] = result
+        logger.debug("Caching %d web results for: %s", len(result), user_query)
+        return result
     
     def _database_search(self, query: str, limit: int) -> List[Dict]:
         """
@@ -95,193 +827,523 @@ class QueryUnderstandingAgent:
         if not query_words:
             return []
         
-        # Search for procedures that might match
-        search_term = f"%{query_words[0]}%"
-        procedures = self.db.query(Procedure).filter(
-            Procedure.description.ilike(search_term)
-        ).limit(limit * 5).all()  # Get extra for strict filtering
+        # PostgreSQL finds candidates with the trigram index, SQLite with the
+        # FTS5 shadow table when the file has one; both are scored below
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "postgresql":
+            procedures = self._trigram_candidates(query, limit * 5)
+        else:
+            procedures = self._fts_candidates(query, limit * 5)
+        if procedures is None:
+            # Search for procedures that might match
+            search_term = f"%{query_words[0]}%"
+            # SQLite's LIKE already ignores ASCII case; ILIKE would add lower() on every row
+            description_like = (
+                Procedure.description.like
+                if dialect == "sqlite"
+                else Procedure.description.ilike
+            )
+            procedures = self.db.query(*_RESULT_COLUMNS).filter(
+                description_like(search_term)
+            ).limit(limit * 5).all()  # Get extra for strict filtering
+        
+        # Tokenize the query once rather than once per candidate row
+        query_tokens = tokenize(query)
+        scored = [
+            (proc, calculate_match_score(query, proc.description, query_tokens))
+            for proc in procedures
+        ]
+        
+        # Only include if score meets minimum threshold
+        scored = [pair for pair in scored if pair[1] >= 0.3]  # Pre-filter low scores
+        
+        # Only the best `limit` are ever used: partial top-k on (row, score) pairs,
+        # building result dicts for the winners only
+        if RAPIDFUZZ_AVAILABLE:
+            best = self._rank_by_similarity(query, scored, limit)
+        else:
+            best = heapq.nlargest(limit, scored, key=itemgetter(1))
+        return [_match(proc, score) for proc, score in best]
+    
+    def _fts_candidates(self, query: str, limit: int) -> Optional[List[Any]]:
+        """
+        Candidate rows from the SQLite FTS5 index, best BM25 rank first.
+        
+        Any query word (as a prefix, so half-typed words still hit) selects a
+        row; scoring stays in Python so match_score keeps its usual scale.
+        Returns None when the database has no FTS table, so the caller falls
+        back to ILIKE.
+        """
+        # Files created before the FTS table existed lack it until create_all() adds it
+        if self.db.get_bind().dialect.name != "sqlite" or not has_table(self.db, "procedures_fts"):
+            return None
+        
+        terms = words(query)
+        if not terms:
+            return None
+        
+        return self.db.execute(
+            _FTS_SEARCH_SQL,
+            {"match": " OR ".join(f'"{term}"*' for term in terms), "limit": limit},
+        ).all()
+    
+    def _trigram_candidates(self, query: str, limit: int) -> List[Any]:
+        """
+        Candidate rows from the pg_trgm GIN index, closest first.
+        
+        Rows are selected by word similarity (the <% operator): how well the
+        query matches the best stretch of the description, so a short query
+        still finds a long description. Whole-string similarity() would drop
+        it below the threshold. Scoring stays in Python so match_score keeps
+        its usual scale.
+        """
+        query_text = literal(query, String)
+        return self.db.query(*_RESULT_COLUMNS).filter(
+            query_text.op("<%", is_comparison=True)(Procedure.description)
+        ).order_by(
+            query_text.op("<<->", return_type=Float)(Procedure.description)
+        ).limit(limit).all()
+    
+    @staticmethod
+    def _rank_by_similarity(
+        query: str, scored: List[Tuple[Any, float]], limit: int
+    ) -> List[Tuple[Any, float]]:
+        """
+        The best `limit` of (row, match score) pairs, breaking score ties by
+        RapidFuzz token-set similarity to the query.
+        
+        The similarity only orders rows that already passed the word-overlap
+        gate; it never lets a row in, and match_score keeps its usual scale.
+        """
+        # Choices come pre-normalized from the cache, so only the query is processed here
+        ratios = {
+            i: ratio
+            for _, ratio, i in process.extract(
+                fuzz_utils.default_process(query),
+                [_desc_features(proc.description).processed for proc, _ in scored],
+                scorer=fuzz.token_set_ratio,
+                processor=None,
+                limit=None,
+            )
+        }
+        # Remaining ties keep candidate order (BM25 rank for FTS candidates)
+        best = heapq.nsmallest(limit, range(len(scored)), key=lambda i: (-scored[i][1], -ratios[i], i))
+        return [scored[i] for i in best]
+    
+    def _hot_query_search(self, query: str, limit: int) -> List[Dict]:
+        """Resolve a named code or pre-registered common query without the LLM or SQL"""
+        cpt_codes = explicit_cpt_codes(query)
+        score = 1.0
+        if not cpt_codes:
+            cpt_codes = lookup_hot_query(query)
+            score = 0.99
+        if not cpt_codes:
+            return []
+        
+        try:
+            index = get_procedure_index(self.db)
+        except Exception as e:
+            logger.warning("Procedure index error: %s", e)
+            return []
         
         matches = []
-        for proc in procedures:
-            score = self._calculate_match_score(query, proc.description)
-            
-            # Only include if score meets minimum threshold
-            if score >= 0.3:  # Pre-filter low scores
-                matches.append({
-                    "cpt_code": proc.cpt_code,
-                    "description": proc.description,
-                    "category": proc.category,
-                    "medicare_rate": proc.medicare_rate,
-                    "match_score": score
-                })
+        for cpt_code in cpt_codes[:limit]:
+            record = index.get(cpt_code)
+            if record:
+                matches.append(_match(record, score))
         
-        # Sort by score
-        matches.sort(key=lambda x: x["match_score"], reverse=True)
         return matches
     
+    def _index_search(self, query: str, limit: int, min_score: float = 0.5) -> List[Dict]:
+        """
+        Look the query up in the in-memory word index over all procedures.
+        
+        Unlike _database_search this uses every query word, in any order.
+        Descriptions contained whole in a longer query ("colonoscopy" in
+        "how much is a colonoscopy") also match, at PHRASE_MATCH_SCORE.
+        """
+        PHRASE_MATCH_SCORE = 0.9
+        
+        try:
+            index = get_procedure_index(self.db)
+            hits = index.search(query, limit)
+            phrase_hits = index.phrase_search(query, limit)
+        except Exception as e:
+            logger.warning("Procedure index search error: %s", e)
+            return []
+        
+        scored = {}
+        for record in phrase_hits:
+            scored[record.cpt_code] = (record, PHRASE_MATCH_SCORE)
+        for record, score in hits:
+            if score >= min_score and score > scored.get(record.cpt_code, (None, 0.0))[1]:
+                scored[record.cpt_code] = (record, score)
+        
+        best = heapq.nlargest(limit, scored.values(), key=itemgetter(1))
+        return [_match(record, score) for record, score in best]
+    
     def _llm_enhanced_search(self, query: str, limit: int) -> List[Dict]:
         """Use LLM to understand query and suggest CPT codes"""
         try:
-            # Get sample procedures for context
-            sample_procs = self.db.query(Procedure).limit(50).all()
-            proc_context = "\n".join([
-                f"{p.cpt_code}: {p.description[:80]}"
-                for p in sample_procs[:30]
-            ])
-            
-            prompt = f"""You are a medical coding assistant. Given a user's natural language query about a medical procedure, find the most relevant CPT codes from the database.
-
-User query: "{query}"
-
-Sample procedures in database:
-{proc_context}
-
-Task: Return ONLY a JSON array of CPT codes (up to 5) that best match this query. Be precise.
-
-Format: ["12345", "67890", "11111"]
-
-If unsure, return fewer codes rather than guessing.
-"""
-            
-            response = self.llm.complete(prompt, temperature=0.1)
-            
-            # Parse LLM response
-            cpt_codes = self._parse_cpt_codes(response)
+            cpt_codes = self._cached_llm_codes(query)
+            if cpt_codes is None:
+                system, prompt = self._build_llm_search_prompt(query)
+                response = self._complete(
+                    prompt, system=system, temperature=0.1, response_format=CPT_CODES_RESPONSE_FORMAT
+                )
+                cpt_codes = self._parse_cpt_codes(response)
+                self._store_llm_codes(query, cpt_codes)
             
             # Fetch full details for these CPT codes
-            matches = []
-            for cpt in cpt_codes:
-                proc = self.db.query(Procedure).filter(
-                    Procedure.cpt_code == cpt
-                ).first()
-                if proc:
-                    matches.append({
-                        "cpt_code": proc.cpt_code,
-                        "description": proc.description,
-                        "category": proc.category,
-                        "medicare_rate": proc.medicare_rate,
-                        "match_score": 0.8  # LLM suggested
-                    })
-            
-            return matches
+            return self._resolve_cpt_codes(cpt_codes, 0.8)  # LLM suggested
             
         except Exception as e:
-            print(f"LLM search error: {e}")
+            logger.warning("LLM search error: %s", e)
             return []
     
+    def _cached_llm_codes(self, query: str) -> Optional[List[str]]:
+        """
+        CPT codes the LLM already suggested for this query or a close paraphrase.
+        
+        Queries are compared by normalize_query() key, so word order, plurals
+        and stopwords never matter ("MRI of the knee" == "knee MRIs"). With
+        RapidFuzz, the nearest cached key within PARAPHRASE_MATCH_CUTOFF also
+        counts, which absorbs typos ("kne mri"), provided it has the same
+        negation and laterality words ("left knee mri" != "right knee mri").
+        The fuzzy scan runs on a snapshot of the keys, outside the cache lock.
+        """
+        key = normalize_query(query)
+        with self._cache_lock:
+            codes = self._llm_codes_cache.get(key)
+            if codes is not None:
+                return list(codes)
+            if not RAPIDFUZZ_AVAILABLE or not self._llm_codes_cache:
+                return None
+            keys = list(self._llm_codes_cache.keys())
+        
+        qualifiers = _QUALIFIER_WORDS.intersection(key.split())
+        nearest = process.extract(
+            key,
+            keys,
+            scorer=fuzz.ratio,
+            processor=None,
+            score_cutoff=PARAPHRASE_MATCH_CUTOFF,
+            limit=PARAPHRASE_CANDIDATES,
+        )
+        for candidate, _, _ in nearest:
+            if _QUALIFIER_WORDS.intersection(candidate.split()) == qualifiers:
+                with self._cache_lock:
+                    codes = self._llm_codes_cache.get(candidate)
+                if codes is not None:
+                    return list(codes)
+        return None
+    
+    def _store_llm_codes(self, query: str, cpt_codes: List[str]) -> None:
+        """Remember the LLM's suggestions; empty answers are retried next time"""
+        if cpt_codes:
+            with self._cache_lock:
+                self._llm_codes_cache[normalize_query(query)] = tuple(cpt_codes)
+    
+    def _complete(
+        self,
+        prompt: str,
+        *,
+        timeout: Optional[float] = None,
+        attempts: int = LLM_MAX_ATTEMPTS,
+        **kwargs
+    ) -> str:
+        """
+        Call the LLM with a bounded wait.
+        
+        A call that exceeds timeout (default request_timeout) is abandoned and
+        retried with exponential backoff; once attempts are exhausted
+        TimeoutError is raised so callers fall back to their non-LLM path.
+        
+        The timeout is also handed to the client's HTTP request (and bounds how
+        long a stream is read), so an abandoned call ends soon after and its
+        _LLM_EXECUTOR worker is free for the next request.
+        """
+        timeout = self.request_timeout if timeout is None else timeout
+        for attempt in range(attempts):
+            call_kwargs = self._timeout_kwargs(timeout, kwargs)
+            if self._streaming:
+                call_kwargs["deadline"] = time.monotonic() + timeout
+            future = _LLM_EXECUTOR.submit(self._llm_call, prompt, **call_kwargs)
+            try:
+                return future.result(timeout=timeout)
+            except TimeoutError:
+                future.cancel()
+                logger.warning("LLM call timed out after %ss (attempt %d)", timeout, attempt + 1)
+                if attempt + 1 < attempts:
+                    time.sleep(LLM_RETRY_BACKOFF * 2 ** attempt)
+        
+        raise TimeoutError(f"LLM did not respond within {timeout}s")
+    
+    async def _complete_async(self, prompt: str, **kwargs) -> str:
+        """Async counterpart of _complete, for use inside the event loop"""
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            call_kwargs = self._timeout_kwargs(self.request_timeout, kwargs)
+            if self._llm_call_async is not None:
+                call = self._llm_call_async(prompt, **call_kwargs)
+            else:
+                if self._streaming:
+                    call_kwargs["deadline"] = time.monotonic() + self.request_timeout
+                call = asyncio.to_thread(self._llm_call, prompt, **call_kwargs)
+            try:
+                return await asyncio.wait_for(call, timeout=self.request_timeout)
+            except TimeoutError:
+                logger.warning("LLM call timed out after %ss (attempt %d)", self.request_timeout, attempt + 1)
+                if attempt + 1 < LLM_MAX_ATTEMPTS:
+                    await asyncio.sleep(LLM_RETRY_BACKOFF * 2 ** attempt)
+        
+        raise TimeoutError(f"LLM did not respond within {self.request_timeout}s")
+    
+    def _timeout_kwargs(self, timeout: float, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """kwargs for one LLM call, with the timeout if the client accepts one"""
+        return {**kwargs, "timeout": timeout} if self._llm_timeout else dict(kwargs)
+    
+    async def _batched_llm_codes(self, query: str, context: str) -> List[str]:
+        """CPT codes the LLM suggests for query, sent along with any concurrent queries"""
+        return await _llm_batcher(self.llm).submit(self, query, context)
+    
+    async def _suggest_codes(self, queries: List[str], context: str) -> List[List[str]]:
+        """One LLM call suggesting CPT codes for each query, in order"""
+        if len(queries) == 1:
+            response = await self._complete_async(
+                self._format_search_prompt(queries[0]),
+                system=_search_system_prompt(context, False),
+                temperature=0.1,
+                response_format=CPT_CODES_RESPONSE_FORMAT,
+            )
+            return [self._parse_cpt_codes(response)]
+        
+        response = await self._complete_async(
+            self._build_llm_batch_prompt(queries),
+            system=_search_system_prompt(context, True),
+            temperature=0.1,
+            response_format=BATCH_CPT_CODES_RESPONSE_FORMAT,
+        )
+        return self._parse_batch_cpt_codes(response, len(queries))
+    
+    def _stream_json(self, prompt: str, deadline: Optional[float] = None, **kwargs) -> str:
+        """
+        Stream a completion, closing the stream once its JSON value is complete
+        (or, with TimeoutError, once deadline passes)
+        """
+        chunks = self.llm.stream(prompt, **kwargs)
+        try:
+            return _read_json_value(chunks, deadline)
+        finally:
+            chunks.close()
+    
+    async def _stream_json_async(self, prompt: str, **kwargs) -> str:
+        """Async _stream_json: closing the generator ends the HTTP response"""
+        chunks = self.llm.stream_async(prompt, **kwargs)
+        try:
+            return await _aread_json_value(chunks)
+        finally:
+            await chunks.aclose()
+    
+    def _build_llm_search_prompt(self, query: str) -> Tuple[str, str]:
+        """
+        Build the CPT suggestion prompt as (system, user) messages.
+        
+        The system message carries the instructions and a sample of the procedure
+        table, identical for every query, so the provider can cache it as a prefix.
+        """
+        return _search_system_prompt(self._prompt_context(), False), self._format_search_prompt(query)
+    
+    def _prompt_context(self) -> str:
+        """Sample of the procedure table shown to the LLM, formatted once per engine"""
+        bind = self.db.get_bind()
+        proc_context = self._prompt_context_cache.get(bind)
+        
+        if proc_context is None:
+            # Sample procedures for context: only the rows and columns the prompt shows
+            sample_procs = self.db.query(
+                Procedure.cpt_code, Procedure.description
+            ).limit(PROMPT_SAMPLE_SIZE).all()
+            proc_context = "\n".join([
+                f"{p.cpt_code}: {p.description[:80]}"
+                for p in sample_procs
+            ])
+            self._prompt_context_cache[bind] = proc_context
+        
+        return proc_context
+    
+    @staticmethod
+    def _format_search_prompt(query: str) -> str:
+        return f'User query: "{query}"'
+    
+    @staticmethod
+    def _build_llm_batch_prompt(queries: List[str]) -> str:
+        """User message listing several queries, numbered as the batch system prompt expects"""
+        numbered = "\n".join(f'{i}. "{query}"' for i, query in enumerate(queries, 1))
+        return f"User queries:\n{numbered}"
+    
+    def _resolve_cpt_codes(self, cpt_codes: List[str], match_score: float) -> List[Dict]:
+        """Look up CPT codes in the database, dropping codes we don't know"""
+        if not cpt_codes:
+            return []
+        
+        # One IN query for all codes, then restore the caller's ranking
+        found = {
+            proc.cpt_code: proc
+            for proc in self.db.query(*_RESULT_COLUMNS).filter(
+                Procedure.cpt_code.in_(cpt_codes)
+            ).all()
+        }
+        
+        matches = []
+        for cpt in cpt_codes:
+            proc = found.get(cpt)
+            if proc:
+                matches.append(_match(proc, match_score))
+        
+        return matches
+    
     def _parse_cpt_codes(self, llm_response: str) -> List[str]:
         """Extract CPT codes from LLM response"""
         try:
-            # Clean response
-            response = llm_response.strip()
-            if response.startswith("```"):
-                response = response.split("```")[1]
-                if response.startswith("json"):
-                    response = response[4:]
-                response = response.strip()
-            
-            codes = json.loads(response)
-            
-            # Validate format - must be 5-digit numeric string
-            valid_codes = []
-            for code in codes:
-                if isinstance(code, str) and len(code) == 5 and code.isdigit():
-                    valid_codes.append(code)
-            
-            return valid_codes
-        except:
+            parsed = _loads_llm_json(llm_response)
+        except (json.JSONDecodeError, TypeError):
             return []
-    
-    def _calculate_match_score(self, query: str, description: str) -> float:
-        """Calculate similarity score between query and description"""
-        query_lower = query.lower()
-        desc_lower = description.lower()
         
-        # Exact phrase match
-        if query_lower in desc_lower:
-            return 1.0
+        codes = parsed.get("cpt_codes") if isinstance(parsed, dict) else parsed
+        return self._valid_cpt_codes(codes)
+    
+    def _parse_batch_cpt_codes(self, llm_response: str, count: int) -> List[List[str]]:
+        """CPT codes per query from a batched LLM response; unanswered queries get []"""
+        answers: List[List[str]] = [[] for _ in range(count)]
+        try:
+            parsed = _loads_llm_json(llm_response)
+        except (json.JSONDecodeError, TypeError):
+            return answers
         
-        # Word overlap
-        query_words = set(query_lower.split())
-        desc_words = set(desc_lower.split())
+        results = parsed.get("results") if isinstance(parsed, dict) else None
+        if not isinstance(results, list):
+            return answers
         
-        if not query_words:
-            return 0.0
+        for result in results:
+            if not isinstance(result, dict):
+                continue
+            number = result.get("query")
+            if isinstance(number, int) and 1 <= number <= count:
+                answers[number - 1] = self._valid_cpt_codes(result.get("cpt_codes"))
         
-        overlap = query_words.intersection(desc_words)
-        score = len(overlap) / len(query_words)
+        return answers
+    
+    @staticmethod
+    def _valid_cpt_codes(codes: Any) -> List[str]:
+        if not isinstance(codes, list):
+            return []
         
-        # Boost for word order matching
-        if all(word in desc_lower for word in query_words):
-            score += 0.2
+        # Validate format - must be 5-digit numeric string
+        valid_codes = []
+        for code in codes:
+            if isinstance(code, str) and len(code) == 5 and code.isdigit():
+                valid_codes.append(sys.intern(code))
         
-        return min(1.0, score)
+        return valid_codes
+    
+    def _calculate_match_score(
+        self,
+        query: str,
+        description: str,
+        query_tokens: Optional[FrozenSet[str]] = None
+    ) -> float:
+        """Calculate similarity score between query and description"""
+        return calculate_match_score(query, description, query_tokens)
     
-    def _web_search_fallback(self, query: str, limit: int) -> List[Dict]:
+    def _web_search_fallback(
+        self,
+        query: str,
+        limit: int,
+        ddg_future: Optional[Future] = None
+    ) -> List[Dict]:
         """
         Use web search to find CPT codes when database is empty.
         Tries DuckDuckGo first, then Google search as fallback.
+        
+        ddg_future, if given, is an in-flight _duckduckgo_fetch for this query.
         """
         # Try DuckDuckGo first
-        results = self._duckduckgo_search(query, limit)
+        results = []
+        if DUCKDUCKGO_AVAILABLE:
+            fetched = None
+            if ddg_future:
+                try:
+                    fetched = ddg_future.result()
+                except Exception as e:
+                    logger.warning("DuckDuckGo prefetch failed: %s", e)
+            results = self._duckduckgo_search(query, limit, fetched)
         
         # If DuckDuckGo returns nothing, try Google search
         if not results:
-            print("DuckDuckGo returned no results, trying Google search fallback...")
+            logger.debug("DuckDuckGo returned no results, trying Google search fallback")
             results = self._google_search(query, limit)
         
         return results
     
-    def _duckduckgo_search(self, query: str, limit: int) -> List[Dict]:
+    def _duckduckgo_fetch(self, query: str) -> Tuple[List[str], List[str]]:
         """
-        Use DuckDuckGo web search to find CPT codes with consensus mechanism.
-        Searches multiple times and returns only codes that appear consistently.
+        Network half of the DuckDuckGo search: no database access, so it can
+        run on a worker thread.
+        
+        Runs a single search and ranks every 5-digit code by how well the
+        text around it matches the query, so the result is deterministic.
+        
+        Returns:
+            (CPT codes best first, text snippets)
         """
-        try:
-            from collections import Counter
-            from ddgs import DDGS
-            
-            # Search for CPT code information
-            search_query = f"{query} CPT code medical procedure"
-            
-            # CONSENSUS MECHANISM: Search multiple times
-            NUM_SEARCHES = 3
-            all_cpt_codes = []
-            all_text_snippets = []
-            
-            for search_attempt in range(NUM_SEARCHES):
-                try:
-                    ddgs = DDGS()
-                    search_results = ddgs.text(search_query, max_results=10)
-                    
-                    if search_results:
-                        search_results = list(search_results)
-                    else:
-                        search_results = []
-                    
-                    # Extract CPT codes from this search
-                    for result in search_results:
-                        title = result.get("title", "")
-                        snippet = result.get("body", "")
-                        text = f"{title} {snippet}"
-                        
-                        if search_attempt == 0:  # Only save snippets from first search
-                            all_text_snippets.append(text)
-                        
-                        # Extract 5-digit codes
-                        potential_cpts = re.findall(r'\b(\d{5})\b', text)
-                        all_cpt_codes.extend(potential_cpts)
-                    
-                except Exception as e:
-                    print(f"DuckDuckGo search attempt {search_attempt + 1} failed: {e}")
-                    continue
-            
-            # Count frequency of each CPT code
-            cpt_counter = Counter(all_cpt_codes)
+        # Search for CPT code information
+        search_query = f"{query} CPT code medical procedure"
+        
+        def run_search() -> List[Dict]:
+            try:
+                return list(_ddgs_client().text(search_query, max_results=10) or [])
+            except Exception as e:
+                logger.warning("DuckDuckGo search failed: %s", e)
+                return []
+        
+        search_results = _cached_serp(("duckduckgo", search_query.lower()), run_search)
+        
+        text_snippets = []
+        code_scores: Dict[str, float] = {}
+        context_query = _context_query(query)
+        
+        for result in search_results:
+            title = result.get("title", "")
+            snippet = result.get("body", "")
+            text = f"{title} {snippet}"
+            text_snippets.append(text)
             
-            # Only keep CPT codes that appeared at least TWICE (consensus)
-            MIN_CONSENSUS = 2
-            cpt_codes_found = {code for code, count in cpt_counter.items() if count >= MIN_CONSENSUS}
+            # Score each code by the text around it, keeping its best mention
+            for match in _CPT_RE.finditer(text):
+                context = text[max(0, match.start() - CPT_CONTEXT_CHARS):match.end() + CPT_CONTEXT_CHARS]
+                score = _context_score(context_query, context)
+                if score > code_scores.get(match.group(), -1.0):
+                    code_scores[match.group()] = score
+        
+        ranked = sorted(
+            (code for code, score in code_scores.items() if score >= MIN_CONTEXT_SCORE),
+            key=lambda code: (-code_scores[code], code)
+        )
+        return ranked, text_snippets
+    
+    def _duckduckgo_search(
+        self,
+        query: str,
+        limit: int,
+        fetched: Optional[Tuple[List[str], List[str]]] = None
+    ) -> List[Dict]:
+        """
+        Use DuckDuckGo web search to find CPT codes, ranked by surrounding context.
+        
+        fetched is a prefetched _duckduckgo_fetch result; if None the search runs here.
+        """
+        try:
+            cpt_codes_found, text_snippets = fetched or self._duckduckgo_fetch(query)
             
             results = []
             
@@ -297,39 +1359,17 @@ If unsure, return fewer codes rather than guessing.
                         text_snippets[:5]
                     )
                 except Exception as e:
-                    print(f"LLM validation failed, using basic descriptions: {e}")
+                    logger.warning("LLM validation failed, using basic descriptions: %s", e)
                     # Fallback: create basic descriptions from query
                     validated_cpts = [(code, f"{query.title()} (CPT {code})") for code in cpt_list[:limit]]
                 
                 # Create results for validated CPT codes
-                for cpt_code, description in validated_cpts[:limit]:
-                    # Check if code exists in database
-                    proc = self.db.query(Procedure).filter(
-                        Procedure.cpt_code == cpt_code
-                    ).first()
-                    
-                    if proc:
-                        results.append({
-                            "cpt_code": proc.cpt_code,
-                            "description": proc.description,
-                            "category": proc.category,
-                            "medicare_rate": proc.medicare_rate,
-                            "match_score": 0.6  # Web search result
-                        })
-                    else:
-                        # CPT code not in our database, use LLM-provided description
-                        results.append({
-                            "cpt_code": cpt_code,
-                            "description": description,
-                            "category": "Web Search Result",
-                            "medicare_rate": None,
-                            "match_score": 0.5  # Lower score for external data
-                        })
+                results = self._web_results(validated_cpts[:limit], "Web Search Result")
             
             return results
             
         except Exception as e:
-            print(f"DuckDuckGo search error: {e}")
+            logger.warning("DuckDuckGo search error: %s", e)
             return []
     
     def _google_search(self, query: str, limit: int) -> List[Dict]:
@@ -340,33 +1380,40 @@ If unsure, return fewer codes rather than guessing.
         try:
             from collections import Counter
             from googlesearch import search
-            import time
             
             search_query = f"{query} CPT code medical procedure"
             
             # CONSENSUS MECHANISM: Search multiple times
             NUM_SEARCHES = 2  # Google is slower, use fewer searches
-            all_cpt_codes = []
+            cpt_counter = Counter()
             text_snippets = []
             
-            for search_attempt in range(NUM_SEARCHES):
+            def run_search(search_attempt: int) -> List[str]:
+                urls = []
                 try:
-                    # Collect search results
-                    for url in search(search_query, num_results=10, lang='en'):
-                        if search_attempt == 0:  # Only save snippets from first search
-                            text_snippets.append(url)
-                        
-                        # Extract 5-digit codes from URLs
-                        potential_cpts = re.findall(r'\b(\d{5})\b', url)
-                        all_cpt_codes.extend(potential_cpts)
-                        time.sleep(0.1)  # Be polite
-                        
+                    # Be polite: one token per request sent, shared with every other search
+                    _GOOGLE_LIMITER.acquire()
+                    urls.extend(search(search_query, num_results=10, lang='en'))
                 except Exception as e:
-                    print(f"Google search attempt {search_attempt + 1} failed: {e}")
-                    continue
+                    logger.warning("Google search attempt %d failed: %s", search_attempt + 1, e)
+                return urls
             
-            # Count frequency of each CPT code
-            cpt_counter = Counter(all_cpt_codes)
+            def run_searches() -> List[List[str]]:
+                # Run the searches concurrently, within the shared rate limit
+                with ThreadPoolExecutor(max_workers=NUM_SEARCHES) as executor:
+                    all_urls = list(executor.map(run_search, range(NUM_SEARCHES)))
+                return all_urls if any(all_urls) else []
+            
+            # The whole consensus round is cached, so a hit can't fake agreement
+            all_search_urls = _cached_serp(("google", search_query.lower()), run_searches)
+            
+            for search_attempt, urls in enumerate(all_search_urls):
+                for url in urls:
+                    if search_attempt == 0:  # Only save snippets from first search
+                        text_snippets.append(url)
+                    
+                    # Extract 5-digit codes from URLs, counting as we go
+                    cpt_counter.update(_CPT_RE.findall(url))
             
             # Only keep CPT codes that appeared at least TWICE (consensus)
             MIN_CONSENSUS = 2
@@ -382,11 +1429,11 @@ If unsure, return fewer codes rather than guessing.
                 
                 for specific_query in specific_queries:
                     try:
+                        _GOOGLE_LIMITER.acquire()
                         for url in search(specific_query, num_results=5, lang='en'):
                             # Extract codes from URL
-                            codes = re.findall(r'\b(\d{5})\b', url)
+                            codes = _CPT_RE.findall(url)
                             cpt_codes_found.update(codes)
-                            time.sleep(0.1)
                         
                         if cpt_codes_found:
                             break
@@ -407,42 +1454,50 @@ If unsure, return fewer codes rather than guessing.
                         text_snippets[:5]
                     )
                 except Exception as e:
-                    print(f"LLM validation failed, using basic descriptions: {e}")
+                    logger.warning("LLM validation failed, using basic descriptions: %s", e)
                     # Fallback: create basic descriptions from query
                     validated_cpts = [(code, f"{query.title()} (CPT {code})") for code in cpt_list[:limit]]
                 
                 # Create results for validated CPT codes
-                for cpt_code, description in validated_cpts[:limit]:
-                    # Check if code exists in database
-                    proc = self.db.query(Procedure).filter(
-                        Procedure.cpt_code == cpt_code
-                    ).first()
-                    
-                    if proc:
-                        results.append({
-                            "cpt_code": proc.cpt_code,
-                            "description": proc.description,
-                            "category": proc.category,
-                            "medicare_rate": proc.medicare_rate,
-                            "match_score": 0.6  # Google search result
-                        })
-                    else:
-                        # CPT code not in our database
-                        results.append({
-                            "cpt_code": cpt_code,
-                            "description": description,
-                            "category": "Web Search Result (Google)",
-                            "medicare_rate": None,
-                            "match_score": 0.5  # Lower score for external data
-                        })
+                results = self._web_results(validated_cpts[:limit], "Web Search Result (Google)")
             
-            print(f"Google search found {len(results)} CPT code results")
+            logger.debug("Google search found %d CPT code results", len(results))
             return results
             
         except Exception as e:
-            print(f"Google search error: {e}")
+            logger.warning("Google search error: %s", e)
             return []
     
+    def _web_results(self, validated_cpts: List[Tuple[str, str]], category: str) -> List[Dict]:
+        """
+        Turn validated (cpt_code, description) pairs into results, preferring
+        our own procedure rows over the web-derived description.
+        
+        Rows come from the in-memory procedure index, so this path runs no SQL.
+        """
+        try:
+            index = get_procedure_index(self.db)
+        except Exception as e:
+            logger.warning("Procedure index error: %s", e)
+            index = None
+        
+        results = []
+        for cpt_code, description in validated_cpts:
+            proc = index.get(cpt_code) if index is not None else None
+            if proc:
+                results.append(_match(proc, 0.6))  # Web search result
+            else:
+                # CPT code not in our database, use LLM-provided description
+                results.append({
+                    "cpt_code": cpt_code,
+                    "description": description,
+                    "category": category,
+                    "medicare_rate": None,
+                    "match_score": 0.5  # Lower score for external data
+                })
+        
+        return results
+    
     def _validate_cpts_with_llm(
         self, 
         query: str, 
@@ -455,6 +1510,16 @@ If unsure, return fewer codes rather than guessing.
         Returns:
             List of tuples (cpt_code, description)
         """
+        # Nothing to rank for a single code: skip the LLM round-trip
+        if len(cpt_codes) <= 1:
+            return [(code, f"{query.title()} (CPT {code})") for code in cpt_codes]
+        
+        cache_key = (query.lower(), frozenset(cpt_codes))
+        with self._cache_lock:
+            cached = self._validation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             context = "\n".join(context_snippets[:3])
             
@@ -467,40 +1532,43 @@ Context from search results:
 
 Task: Identify which CPT codes are most relevant for "{query}" and provide a brief description for each.
 
-Return ONLY a JSON array of objects with this format:
-[
+Return JSON with this format:
+{{"procedures": [
   {{"cpt_code": "12345", "description": "Brief procedure description"}},
   {{"cpt_code": "67890", "description": "Another procedure description"}}
-]
+]}}
 
 Only include CPT codes that are truly relevant. Maximum 3 codes.
 """
             
-            response = self.llm.complete(prompt, temperature=0)
+            # Validation is optional polish: one short attempt, then the generic fallback
+            response = self._complete(
+                prompt,
+                timeout=VALIDATION_TIMEOUT,
+                attempts=1,
+                temperature=0,
+                response_format=VALIDATED_CPTS_RESPONSE_FORMAT
+            )
             
-            # Parse response
-            response = response.strip()
-            if response.startswith("```"):
-                response = response.split("```")[1]
-                if response.startswith("json"):
-                    response = response[4:]
-                response = response.strip()
-            
-            parsed = json.loads(response)
+            parsed = _loads_llm_json(response)
+            items = parsed["procedures"] if isinstance(parsed, dict) else parsed
             
             # Extract (code, description) tuples
             result = []
-            for item in parsed:
+            for item in items:
                 if isinstance(item, dict) and "cpt_code" in item and "description" in item:
-                    code = str(item["cpt_code"])
+                    code = sys.intern(str(item["cpt_code"]))
                     desc = str(item["description"])
                     if len(code) == 5 and code.isdigit():
                         result.append((code, desc))
             
+            # Only real LLM verdicts are cached; the fallback below is retried next time
+            with self._cache_lock:
+                self._validation_cache[cache_key] = result
             return result
             
         except Exception as e:
-            print(f"LLM validation error: {e}")
+            logger.warning("LLM validation error: %s", e)
             # Return first few codes with generic descriptions as fallback
             return [(code, f"Procedure related to {query}") for code in cpt_codes[:3]]
     
@@ -522,3 +1590,12 @@ Only include CPT codes that are truly relevant. Maximum 3 codes.
                 merged.append(result)
         
         return merged[:limit]
+
+
+def _procedures_changed(*_args) -> None:
+    """Procedure rows changed: drop cached answers and the prompt sample"""
+    QueryUnderstandingAgent.cache_clear()
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Procedure, _event_name, _procedures_changed)
@@ -19,6 +19,12 @@ class Settings:
     GOOGLE_SEARCH_API_KEY: Optional[str] = os.getenv("GOOGLE_SEARCH_API_KEY") or None
     GOOGLE_SEARCH_CSE_ID: Optional[str] = os.getenv("GOOGLE_SEARCH_CSE_ID") or None
     
+    # Scraped Google searches per second, shared by all concurrent requests
+    GOOGLE_SEARCH_RATE_LIMIT: float = float(os.getenv("GOOGLE_SEARCH_RATE_LIMIT", "2"))
+    
+    # Optional JSON file of extra common-query phrases -> CPT codes
+    HOT_QUERIES_PATH: Optional[str] = os.getenv("HOT_QUERIES_PATH") or None
+    
     @property
     def google_search_enabled(self) -> bool:
         """Check if Google Search API is configured."""
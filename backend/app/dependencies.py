@@ -2,6 +2,7 @@
 FastAPI dependency injection utilities.
 """
 
+from functools import lru_cache
 from typing import Generator, Optional
 
 from sqlalchemy.orm import Session
@@ -22,9 +23,12 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+@lru_cache(maxsize=1)
 def get_search_client() -> Optional[DuckDuckGoSearchClient | GoogleSearchClient]:
     """
-    Provide a search client instance (DuckDuckGo or Google).
+    Provide the shared search client instance (DuckDuckGo or Google).
+    
+    Built once per process so its HTTP connection pool outlives the request.
     
     Priority:
     1. DuckDuckGo (if available) - No API key needed, preferred!
@@ -49,9 +53,10 @@ def get_search_client() -> Optional[DuckDuckGoSearchClient | GoogleSearchClient]
 
 
 # Keep legacy function for backward compatibility
+@lru_cache(maxsize=1)
 def get_google_search_client() -> Optional[GoogleSearchClient]:
     """
-    Provide a GoogleSearchClient instance if configured, otherwise None.
+    Provide the shared GoogleSearchClient instance if configured, otherwise None.
     
     Deprecated: Use get_search_client() instead.
     """
@@ -2,15 +2,33 @@
 FastAPI main application entry point.
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
+from agents.openrouter_llm import close_async_clients
+from app.middleware import ETagMiddleware
 from app.routers import pricing, procedures, providers
+from app.services.npi_client import close_npi_clients
+from database import engine
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Close pooled LLM, NPI registry and database connections on shutdown
+    await close_async_clients()
+    await close_npi_clients()
+    engine.dispose()
+
 
 app = FastAPI(
     title="Healthcare Price Transparency API",
     description="API for accessing healthcare pricing data and provider information",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS configuration
@@ -22,6 +40,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Repeat GETs of unchanged data get a 304; everything else larger than 500 bytes
+# is compressed. Added last so it runs outermost and the ETag hashes the raw JSON.
+app.add_middleware(ETagMiddleware)
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
 # Include routers
 app.include_router(pricing.router, prefix="/api/pricing", tags=["pricing"])
 app.include_router(procedures.router, prefix="/api/procedures", tags=["procedures"])
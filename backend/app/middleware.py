@@ -0,0 +1,80 @@
+"""
+HTTP middleware for the API.
+"""
+
+from hashlib import blake2b
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class ETagMiddleware:
+    """
+    Weak ETags for GET responses, answering matching If-None-Match with 304.
+
+    Clients that poll the same pricing or procedure listing get an empty 304
+    instead of the full JSON body again. Streamed responses pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        response_start: Optional[Message] = None
+        passthrough = False
+
+        async def send_with_etag(message: Message) -> None:
+            nonlocal response_start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                if message["status"] != 200 or "etag" in Headers(raw=message["headers"]):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held back until the body shows whether the client's copy is current
+                    response_start = message
+                return
+
+            if message.get("more_body", False):
+                # Streamed response: forward as-is
+                passthrough = True
+                await send(response_start)
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=response_start)
+            etag = f'W/"{blake2b(message.get("body", b""), digest_size=8).hexdigest()}"'
+            headers["ETag"] = etag
+
+            if if_none_match and _etag_matches(if_none_match, etag):
+                del headers["content-length"]
+                del headers["content-type"]
+                response_start["status"] = 304
+                await send(response_start)
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            await send(response_start)
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against etag"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
@@ -3,22 +3,31 @@ Procedure-related API endpoints.
 """
 
 import os
+import re
+from functools import lru_cache
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from app.dependencies import get_db
 from app.schemas import ProcedureSummary
-from database import Procedure
+from database import Procedure, has_table
+from agents.procedure_index import get_procedure_index
 from agents.query_understanding_agent import QueryUnderstandingAgent
 from agents.openrouter_llm import OpenRouterLLMClient
 
 router = APIRouter()
 
+# FTS5's default tokenizer splits on the same boundaries
+_SEARCH_WORD_RE = re.compile(r"[a-z0-9]+")
 
+
+@lru_cache(maxsize=1)
 def get_llm_client():
-    """Get LLM client for Query Understanding Agent"""
+    """Get the shared LLM client for Query Understanding Agent"""
     api_key = os.getenv("OPENROUTER_API_KEY", "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")
     return OpenRouterLLMClient(api_key=api_key)
 
@@ -36,6 +45,10 @@ def list_procedures(
     query = db.query(Procedure)
 
     if q:
+        indexed_search = _indexed_search_filter(db, q)
+        if indexed_search is not None:
+            return _first_procedures(query.filter(indexed_search), limit)
+
         # Search in both CPT code and description
         search_pattern = f"%{q}%"
         query = query.filter(
@@ -50,20 +63,51 @@ def list_procedures(
             Procedure.cpt_code.op('GLOB')('[0-9][0-9][0-9][0-9][0-9]')
         )
 
-    # Prioritize procedures with categories (common procedures) first, then by CPT code
-    from sqlalchemy import case
+    return _first_procedures(query, limit)
+
+
+def _first_procedures(query, limit: int) -> List[ProcedureSummary]:
+    """The first `limit` procedures of a filtered query, in listing order"""
+    # Prioritize procedures with categories (common procedures) first, then by CPT code.
+    # "category IS NULL" sorts false first and matches idx_procedure_cpt5, so SQLite
+    # reads the first rows straight off the index instead of sorting the table.
     procedures = query.order_by(
-        case(
-            (Procedure.category.isnot(None), 0),
-            else_=1
-        ),
+        Procedure.category.is_(None),
         Procedure.cpt_code.asc()
     ).limit(limit).all()
     return [ProcedureSummary.model_validate(procedure) for procedure in procedures]
 
 
+def _indexed_search_filter(db: Session, q: str):
+    """
+    Index-backed form of the code/description search, or None if there isn't one.
+    
+    On SQLite, codes match by prefix (a range on the primary key) and descriptions
+    by phrase prefix in the procedures_fts table ("x-ray st" finds "X-RAY STRESS VIEW"),
+    so no row is scanned. Elsewhere the caller falls back to ILIKE.
+    """
+    terms = _SEARCH_WORD_RE.findall(q.lower())
+    if db.get_bind().dialect.name != "sqlite" or not terms:
+        return None
+    # Files created before the FTS table existed lack it until create_all() adds it
+    if not has_table(db, "procedures_fts"):
+        return None
+
+    # Codes are stored upper-case; every code starting with the prefix sorts below
+    # prefix + the highest code point
+    code_prefix = q.strip().upper()
+    description_match = text(
+        "procedures.rowid IN "
+        "(SELECT rowid FROM procedures_fts WHERE procedures_fts MATCH :fts_match)"
+    ).bindparams(fts_match=f'"{" ".join(terms)}"*')
+    return (
+        (Procedure.cpt_code >= code_prefix)
+        & (Procedure.cpt_code < code_prefix + "\U0010ffff")
+    ) | description_match
+
+
 @router.get("/smart-search", response_model=List[ProcedureSummary])
-def smart_search_procedures(
+async def smart_search_procedures(
     q: str = Query(..., description="Natural language query (e.g., 'knee MRI', 'chest x-ray')"),
     limit: int = Query(10, ge=1, le=50, description="Maximum number of results"),
     db: Session = Depends(get_db),
@@ -81,17 +125,17 @@ def smart_search_procedures(
         llm_client = get_llm_client()
         agent = QueryUnderstandingAgent(llm_client, db)
         
-        # Use agent to search
-        results = agent.search_procedures(q, limit)
+        # Use agent to search (DB and LLM run concurrently)
+        results = await agent.search_procedures_async(q, limit)
+        
+        # Our own procedure rows (web results may have none) come from the in-memory
+        # index. Building it reads the table, so that runs on the threadpool.
+        index = await run_in_threadpool(get_procedure_index, db)
         
         # Convert to ProcedureSummary format
         procedures = []
         for result in results:
-            # First try to get from database
-            proc = db.query(Procedure).filter(
-                Procedure.cpt_code == result["cpt_code"]
-            ).first()
-            
+            proc = index.get(result["cpt_code"])
             if proc:
                 # Procedure exists in database
                 procedures.append(ProcedureSummary.model_validate(proc))
@@ -111,7 +155,7 @@ def smart_search_procedures(
         import traceback
         traceback.print_exc()
         # Fallback to regular search on error
-        return list_procedures(q=q, limit=limit, db=db)
+        return await run_in_threadpool(list_procedures, q=q, limit=limit, db=db)
 
 
 @router.get("/{cpt_code}", response_model=ProcedureSummary)
@@ -121,10 +165,12 @@ def get_procedure(
 ) -> ProcedureSummary:
     """
     Retrieve a single procedure by CPT code.
+    
+    Served from the in-memory procedure index; ORM writes to procedures invalidate it.
     """
     from fastapi import HTTPException
     
-    procedure = db.query(Procedure).filter(Procedure.cpt_code == cpt_code).first()
+    procedure = get_procedure_index(db).get(cpt_code)
 
     if not procedure:
         raise HTTPException(status_code=404, detail="Procedure not found")
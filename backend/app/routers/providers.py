@@ -2,16 +2,23 @@
 Provider-related API endpoints.
 """
 
-from typing import List, Optional
+from itertools import islice
+from typing import Iterator, List, Optional
+import asyncio
+import threading
+import weakref
 
-from fastapi import APIRouter, Depends, HTTPException
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 
 from app.dependencies import get_db
 from app.schemas import (
-    PriceDetail,
     PriceEstimateItem,
-    ProcedureSummary,
     ProviderSummary,
 )
 from app.services import NpiClient
@@ -19,6 +26,29 @@ from database import PriceTransparency, Procedure, Provider
 
 _npi_client = NpiClient()
 
+# Whole result lists validate in one pydantic-core call instead of one per row
+_PROVIDER_LIST_ADAPTER = TypeAdapter(List[ProviderSummary])
+_PRICE_LIST_ADAPTER = TypeAdapter(List[PriceEstimateItem])
+
+# Price rows fetched and serialized per batch when streaming a provider's prices
+PRICE_STREAM_BATCH_SIZE = 500
+
+# Provider listings select just the columns ProviderSummary declares and validate
+# the row mappings, skipping ORM object hydration and the identity map
+_PROVIDER_SUMMARY_COLUMNS = tuple(getattr(Provider, field) for field in ProviderSummary.model_fields)
+
+# Serialized JSON of provider listings and lookups by id, one cache per database
+# engine. Provider writes through the ORM clear them (see bottom of module); the
+# TTL bounds staleness for rows changed outside this process.
+PROVIDER_CACHE_SIZE = 1024
+PROVIDER_CACHE_TTL = 120
+
+_provider_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_provider_lock = threading.Lock()
+
+# list_providers, get_provider and get_provider_prices return JSON already
+# serialized through the adapters above (a Response or StreamingResponse), which
+# FastAPI sends as is: their response_model only documents the schema in OpenAPI.
 router = APIRouter()
 
 
@@ -26,12 +56,19 @@ router = APIRouter()
 def list_providers(
     state: Optional[str] = None,
     city: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of providers to return"),
+    offset: int = Query(0, ge=0, description="Number of providers to skip"),
     db: Session = Depends(get_db),
-) -> List[ProviderSummary]:
+) -> Response:
     """
-    Return all providers, optionally filtered by state or city.
+    Return providers by name, optionally filtered by state or city, a page at a time.
     """
-    query = db.query(Provider)
+    key = ("list", state.upper() if state else None, city, limit, offset)
+    body = _cached_body(db, key)
+    if body is not None:
+        return _json_response(body)
+
+    query = db.query(*_PROVIDER_SUMMARY_COLUMNS)
 
     if state:
         query = query.filter(Provider.state == state.upper())
@@ -39,12 +76,19 @@ def list_providers(
     if city:
         query = query.filter(Provider.city.ilike(f"%{city}%"))
 
-    providers = query.order_by(Provider.name.asc()).all()
-    return [ProviderSummary.model_validate(provider) for provider in providers]
+    # id breaks ties between same-named providers so pages neither overlap nor skip
+    rows = (
+        query.order_by(Provider.name.asc(), Provider.id.asc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    summaries = _PROVIDER_LIST_ADAPTER.validate_python([row._mapping for row in rows])
+    return _json_response(_store_body(db, key, _PROVIDER_LIST_ADAPTER.dump_json(summaries)))
 
 
 @router.get("/lookup", response_model=List[ProviderSummary])
-def lookup_providers(
+async def lookup_providers(
     city: str,
     state: str,
     limit: int = 20,
@@ -52,25 +96,33 @@ def lookup_providers(
 ) -> List[ProviderSummary]:
     """
     Retrieve providers from the local database and supplement with NPI data.
+
+    The database query runs on the threadpool while the NPI request is already
+    in flight on the event loop; the request is cancelled if local providers
+    alone fill the limit.
     """
     normalized_state = state.upper()
 
-    db_providers = (
-        db.query(Provider)
-        .filter(Provider.state == normalized_state)
-        .filter(Provider.city.ilike(f"{city}%"))
-        .order_by(Provider.name.asc())
-        .limit(limit)
-        .all()
+    npi_task = asyncio.create_task(
+        _npi_client.lookup_async(city=city, state=normalized_state, limit=limit)
     )
+    # A discarded lookup's failure is not an error worth logging
+    npi_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    try:
+        summaries = await run_in_threadpool(
+            _local_providers, db, city=city, state=normalized_state, limit=limit
+        )
+    except BaseException:
+        npi_task.cancel()
+        raise
 
-    summaries = [ProviderSummary.model_validate(provider) for provider in db_providers]
     if len(summaries) >= limit:
+        npi_task.cancel()
         return summaries
 
-    seen_npis = {provider.npi for provider in db_providers if provider.npi}
+    seen_npis = {summary.npi for summary in summaries if summary.npi}
     try:
-        npi_results = _npi_client.lookup(city=city, state=normalized_state, limit=limit)
+        npi_results = await npi_task
     except Exception as exc:  # pragma: no cover - external API failure
         raise HTTPException(status_code=502, detail=f"NPI lookup failed: {exc}") from exc
 
@@ -100,46 +152,117 @@ def lookup_providers(
     return summaries
 
 
+def _local_providers(db: Session, *, city: str, state: str, limit: int) -> List[ProviderSummary]:
+    """Providers in the database whose city starts with city, by name"""
+    rows = (
+        db.query(*_PROVIDER_SUMMARY_COLUMNS)
+        .filter(Provider.state == state)
+        .filter(Provider.city.ilike(f"{city}%"))
+        .order_by(Provider.name.asc())
+        .limit(limit)
+    )
+    return _PROVIDER_LIST_ADAPTER.validate_python([row._mapping for row in rows])
+
+
 @router.get("/{provider_id}", response_model=ProviderSummary)
-def get_provider(provider_id: int, db: Session = Depends(get_db)) -> ProviderSummary:
+def get_provider(provider_id: int, db: Session = Depends(get_db)) -> Response:
     """
     Retrieve a single provider by ID.
     """
-    provider = db.query(Provider).filter(Provider.id == provider_id).first()
+    key = ("get", provider_id)
+    body = _cached_body(db, key)
+    if body is not None:
+        return _json_response(body)
+
+    row = db.query(*_PROVIDER_SUMMARY_COLUMNS).filter(Provider.id == provider_id).first()
 
-    if not provider:
+    if not row:
         raise HTTPException(status_code=404, detail="Provider not found")
 
-    return ProviderSummary.model_validate(provider)
+    summary = ProviderSummary.model_validate(row._mapping)
+    return _json_response(_store_body(db, key, summary.model_dump_json().encode()))
 
 
 @router.get("/{provider_id}/prices", response_model=List[PriceEstimateItem])
 def get_provider_prices(
     provider_id: int,
     db: Session = Depends(get_db),
-) -> List[PriceEstimateItem]:
+) -> StreamingResponse:
     """
     Retrieve all price transparency records for a provider.
-    """
-    provider = db.query(Provider).filter(Provider.id == provider_id).first()
-    if not provider:
-        raise HTTPException(status_code=404, detail="Provider not found")
 
-    records = (
-        db.query(PriceTransparency, Procedure)
-        .join(Procedure, PriceTransparency.cpt_code == Procedure.cpt_code)
-        .filter(PriceTransparency.provider_id == provider_id)
+    One round-trip: the provider is outer-joined to its prices, so a provider
+    without prices still comes back (as a single row with no price). Rows are
+    fetched, validated and sent as a JSON array PRICE_STREAM_BATCH_SIZE at a
+    time, so a provider with thousands of prices is never held in memory whole.
+    """
+    rows = iter(
+        db.query(Provider, PriceTransparency, Procedure)
+        .outerjoin(PriceTransparency, PriceTransparency.provider_id == Provider.id)
+        .outerjoin(Procedure, PriceTransparency.cpt_code == Procedure.cpt_code)
+        .filter(Provider.id == provider_id)
         .order_by(PriceTransparency.payer_name.asc())
-        .all()
+        .yield_per(PRICE_STREAM_BATCH_SIZE)
     )
+    first = next(rows, None)
+    if first is None:
+        raise HTTPException(status_code=404, detail="Provider not found")
+
+    provider_summary = ProviderSummary.model_validate(first[0])
+
+    def price_batches() -> Iterator[bytes]:
+        yield b"["
+        separator = b""
+        batch = [first, *islice(rows, PRICE_STREAM_BATCH_SIZE - 1)]
+        while batch:
+            items = [
+                {"provider": provider_summary, "procedure": procedure, "price": price}
+                for _, price, procedure in batch
+                # Prices whose code has no procedure row are skipped, as with an inner join
+                if price is not None and procedure is not None
+            ]
+            if items:
+                array = _PRICE_LIST_ADAPTER.dump_json(
+                    _PRICE_LIST_ADAPTER.validate_python(items, from_attributes=True)
+                )
+                yield separator + array[1:-1]
+                separator = b","
+            batch = list(islice(rows, PRICE_STREAM_BATCH_SIZE))
+        yield b"]"
+
+    return StreamingResponse(price_batches(), media_type="application/json")
+
+
+def _cached_body(db: Session, key: tuple) -> Optional[bytes]:
+    """Serialized response for key from this database's cache, if still fresh"""
+    with _provider_lock:
+        cache = _provider_caches.get(db.get_bind())
+        return cache.get(key) if cache is not None else None
+
+
+def _store_body(db: Session, key: tuple, body: bytes) -> bytes:
+    """Cache a serialized response for key and return it"""
+    bind = db.get_bind()
+    with _provider_lock:
+        cache = _provider_caches.get(bind)
+        if cache is None:
+            cache = _provider_caches[bind] = TTLCache(
+                maxsize=PROVIDER_CACHE_SIZE, ttl=PROVIDER_CACHE_TTL
+            )
+        cache[key] = body
+    return body
+
+
+def _json_response(body: bytes) -> Response:
+    """Already-serialized JSON, sent without another pass through the response model"""
+    return Response(content=body, media_type="application/json")
+
+
+def clear_provider_cache(*_args) -> None:
+    """Drop cached provider responses; the next request queries the database"""
+    with _provider_lock:
+        _provider_caches.clear()
 
-    provider_summary = ProviderSummary.model_validate(provider)
-    return [
-        PriceEstimateItem(
-            provider=provider_summary,
-            procedure=ProcedureSummary.model_validate(procedure),
-            price=PriceDetail.model_validate(price),
-        )
-        for price, procedure in records
-    ]
 
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Provider, _event_name, clear_provider_cache)
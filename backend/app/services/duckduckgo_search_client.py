@@ -6,6 +6,7 @@ No API key required - completely free!
 from __future__ import annotations
 
 import re
+import threading
 from typing import List, Optional
 from dataclasses import dataclass
 
@@ -14,6 +15,21 @@ try:
 except ImportError:
     DDGS = None
 
+# Compiled once: the extractors below run on every result of every search
+_PRICE_RE = re.compile(r'\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)')  # Dollar amounts
+_TITLE_SEPARATOR_RE = re.compile(r"[|\-–—:]")
+_DOMAIN_RE = re.compile(r"https?://(?:www\.)?([^/]+)")
+_LOCATION_RE = re.compile(r"([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*),\s*([A-Z]{2})")  # "Los Angeles, CA"
+
+# A title that leads with one of these is taken to name the provider
+_HEALTHCARE_KEYWORDS = (
+    "hospital",
+    "medical center",
+    "health system",
+    "clinic",
+    "healthcare",
+)
+
 
 @dataclass
 class SearchResult:
@@ -51,6 +67,15 @@ class DuckDuckGoSearchClient:
                 "pip install duckduckgo-search"
             )
         self.timeout = timeout
+        # One DDGS per thread, kept open so repeat searches reuse its connections
+        self._local = threading.local()
+    
+    def _ddgs(self) -> DDGS:
+        """This thread's DDGS session, created on first use"""
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            ddgs = self._local.ddgs = DDGS(timeout=self.timeout)
+        return ddgs
     
     def search_cpt_pricing(
         self,
@@ -86,24 +111,25 @@ class DuckDuckGoSearchClient:
         query = " ".join(query_parts)
         
         try:
-            with DDGS() as ddgs:
-                # Perform search
-                search_results = ddgs.text(
-                    keywords=query,
-                    region='wt-wt',  # Worldwide, no tracking
-                    safesearch='moderate',
-                    max_results=num_results,
-                )
-                
-                # Convert to list if it's a generator
-                if search_results:
-                    search_results = list(search_results)
-                else:
-                    search_results = []
+            # Perform search
+            search_results = self._ddgs().text(
+                keywords=query,
+                region='wt-wt',  # Worldwide, no tracking
+                safesearch='moderate',
+                max_results=num_results,
+            )
+            
+            # Convert to list if it's a generator
+            if search_results:
+                search_results = list(search_results)
+            else:
+                search_results = []
             
             return self._parse_results(search_results, cpt_code)
             
         except Exception:
+            # Drop the session in case it is what failed; the next search opens a new one
+            self._local.ddgs = None
             # Return empty list on error rather than failing
             return []
     
@@ -161,10 +187,7 @@ class DuckDuckGoSearchClient:
         - $1234
         - 1,234.56
         """
-        # Pattern to match dollar amounts
-        price_pattern = r'\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)'
-        
-        matches = re.findall(price_pattern, text)
+        matches = _PRICE_RE.findall(text)
         prices = []
         
         for match in matches:
@@ -185,25 +208,17 @@ class DuckDuckGoSearchClient:
         
         This is a simple heuristic - looks for common patterns.
         """
-        # Common hospital/healthcare keywords
-        healthcare_keywords = [
-            "hospital",
-            "medical center",
-            "health system",
-            "clinic",
-            "healthcare",
-        ]
-        
         # Check title for provider name (first part before separator)
-        title_parts = re.split(r"[|\-–—:]", title)
+        title_parts = _TITLE_SEPARATOR_RE.split(title)
         if title_parts:
             first_part = title_parts[0].strip()
+            lowered = first_part.lower()
             # If it contains healthcare keywords, it's likely a provider name
-            if any(keyword in first_part.lower() for keyword in healthcare_keywords):
+            if any(keyword in lowered for keyword in _HEALTHCARE_KEYWORDS):
                 return first_part
         
         # Try to extract from domain
-        domain_match = re.search(r"https?://(?:www\.)?([^/]+)", url)
+        domain_match = _DOMAIN_RE.search(url)
         if domain_match:
             domain = domain_match.group(1)
             # Clean up domain to make it readable
@@ -224,10 +239,7 @@ class DuckDuckGoSearchClient:
         
         Looks for city, state patterns.
         """
-        # Pattern for city, state (e.g., "Los Angeles, CA" or "New York, NY")
-        location_pattern = r"([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*),\s*([A-Z]{2})"
-        
-        match = re.search(location_pattern, text)
+        match = _LOCATION_RE.search(text)
         if match:
             return f"{match.group(1)}, {match.group(2)}"
         
@@ -258,6 +270,7 @@ class DuckDuckGoSearchClient:
         
         all_prices.sort()
         n = len(all_prices)
+        avg = sum(all_prices) / n
         
         # Calculate median
         if n % 2 == 0:
@@ -270,9 +283,8 @@ class DuckDuckGoSearchClient:
         
         # If variance is high, reduce confidence
         if n > 1:
-            variance = sum((p - (sum(all_prices) / n)) ** 2 for p in all_prices) / n
+            variance = sum((p - avg) ** 2 for p in all_prices) / n
             std_dev = variance ** 0.5
-            avg = sum(all_prices) / n
             coefficient_of_variation = std_dev / avg if avg > 0 else 0
             
             # High variance reduces confidence
@@ -280,9 +292,9 @@ class DuckDuckGoSearchClient:
                 confidence *= 0.7
         
         return {
-            "min": round(min(all_prices), 2),
-            "max": round(max(all_prices), 2),
-            "average": round(sum(all_prices) / n, 2),
+            "min": round(all_prices[0], 2),
+            "max": round(all_prices[-1], 2),
+            "average": round(avg, 2),
             "median": round(median, 2),
             "confidence": round(confidence, 2),
         }
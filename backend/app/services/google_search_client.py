@@ -4,12 +4,20 @@ Google Custom Search API client for healthcare pricing lookups.
 
 from __future__ import annotations
 
-import re
 from typing import List, Optional
 from dataclasses import dataclass
 
 import httpx
 
+# Result parsing matches the DuckDuckGo client's, so the patterns live there
+from .duckduckgo_search_client import (
+    _DOMAIN_RE,
+    _HEALTHCARE_KEYWORDS,
+    _LOCATION_RE,
+    _PRICE_RE,
+    _TITLE_SEPARATOR_RE,
+)
+
 
 @dataclass
 class SearchResult:
@@ -164,10 +172,7 @@ class GoogleSearchClient:
         - $1234
         - 1,234.56
         """
-        # Pattern to match dollar amounts
-        price_pattern = r'\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)'
-        
-        matches = re.findall(price_pattern, text)
+        matches = _PRICE_RE.findall(text)
         prices = []
         
         for match in matches:
@@ -188,25 +193,17 @@ class GoogleSearchClient:
         
         This is a simple heuristic - looks for common patterns.
         """
-        # Common hospital/healthcare keywords
-        healthcare_keywords = [
-            "hospital",
-            "medical center",
-            "health system",
-            "clinic",
-            "healthcare",
-        ]
-        
         # Check title for provider name (first part before separator)
-        title_parts = re.split(r"[|\-–—:]", title)
+        title_parts = _TITLE_SEPARATOR_RE.split(title)
         if title_parts:
             first_part = title_parts[0].strip()
+            lowered = first_part.lower()
             # If it contains healthcare keywords, it's likely a provider name
-            if any(keyword in first_part.lower() for keyword in healthcare_keywords):
+            if any(keyword in lowered for keyword in _HEALTHCARE_KEYWORDS):
                 return first_part
         
         # Try to extract from domain
-        domain_match = re.search(r"https?://(?:www\.)?([^/]+)", url)
+        domain_match = _DOMAIN_RE.search(url)
         if domain_match:
             domain = domain_match.group(1)
             # Clean up domain to make it readable
@@ -227,10 +224,7 @@ class GoogleSearchClient:
         
         Looks for city, state patterns.
         """
-        # Pattern for city, state (e.g., "Los Angeles, CA" or "New York, NY")
-        location_pattern = r"([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*),\s*([A-Z]{2})"
-        
-        match = re.search(location_pattern, text)
+        match = _LOCATION_RE.search(text)
         if match:
             return f"{match.group(1)}, {match.group(2)}"
         
@@ -261,6 +255,7 @@ class GoogleSearchClient:
         
         all_prices.sort()
         n = len(all_prices)
+        avg = sum(all_prices) / n
         
         # Calculate median
         if n % 2 == 0:
@@ -273,9 +268,8 @@ class GoogleSearchClient:
         
         # If variance is high, reduce confidence
         if n > 1:
-            variance = sum((p - (sum(all_prices) / n)) ** 2 for p in all_prices) / n
+            variance = sum((p - avg) ** 2 for p in all_prices) / n
             std_dev = variance ** 0.5
-            avg = sum(all_prices) / n
             coefficient_of_variation = std_dev / avg if avg > 0 else 0
             
             # High variance reduces confidence
@@ -283,9 +277,9 @@ class GoogleSearchClient:
                 confidence *= 0.7
         
         return {
-            "min": round(min(all_prices), 2),
-            "max": round(max(all_prices), 2),
-            "average": round(sum(all_prices) / n, 2),
+            "min": round(all_prices[0], 2),
+            "max": round(all_prices[-1], 2),
+            "average": round(avg, 2),
             "median": round(median, 2),
             "confidence": round(confidence, 2),
         }
@@ -4,11 +4,48 @@ Client for the CMS NPI Registry API.
 
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import threading
+import weakref
 
 import httpx
+from cachetools import TTLCache
 from pydantic import BaseModel, Field
 
+# Async HTTP clients shared by every NpiClient, one per event loop, so registry
+# lookups reuse open connections instead of a fresh TLS handshake each time
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _shared_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=8, max_connections=16),
+        )
+    return client
+
+
+# Registry results by normalized (city, state, limit), shared by every NpiClient.
+# Listings change rarely, so an hour of staleness is acceptable.
+NPI_CACHE_SIZE = 10_000
+NPI_CACHE_TTL = 3600
+
+_lookup_cache: TTLCache = TTLCache(maxsize=NPI_CACHE_SIZE, ttl=NPI_CACHE_TTL)
+_lookup_lock = threading.Lock()
+
+# Registry requests in flight per event loop, so concurrent identical misses share one
+_inflight: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+async def close_npi_clients() -> None:
+    """Close the running loop's shared async HTTP client (call on app shutdown)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
 
 class NpiAddress(BaseModel):
     """Normalized address information returned by the NPI Registry API."""
@@ -40,6 +77,7 @@ class NpiClient:
     BASE_URL = "https://npiregistry.cms.hhs.gov/api/"
 
     def __init__(self, *, timeout: float = 5.0):
+        self._timeout = timeout
         self._client = httpx.Client(timeout=timeout)
 
     def lookup(
@@ -52,19 +90,76 @@ class NpiClient:
         """
         Fetch providers for a given city/state combination.
 
-        Only organization records (NPI-2) are returned.
+        Only organization records (NPI-2) are returned. Results are cached for
+        NPI_CACHE_TTL seconds.
         """
-        params = {
+        key = self._cache_key(city, state, limit)
+        with _lookup_lock:
+            providers = _lookup_cache.get(key)
+        if providers is None:
+            response = self._client.get(self.BASE_URL, params=self._params(*key))
+            response.raise_for_status()
+            providers = self._store(key, self._parse_providers(response.json()))
+        return list(providers)
+
+    async def lookup_async(
+        self,
+        *,
+        city: str,
+        state: str,
+        limit: int = 20,
+    ) -> List[NpiProvider]:
+        """
+        Same as lookup(), without blocking the event loop on the registry request.
+
+        Concurrent misses for the same key await a single request. Cancelling
+        one caller leaves the request running for the others (and the cache).
+        """
+        key = self._cache_key(city, state, limit)
+        with _lookup_lock:
+            providers = _lookup_cache.get(key)
+        if providers is not None:
+            return list(providers)
+
+        pending = _inflight.setdefault(asyncio.get_running_loop(), {})
+        task = pending.get(key)
+        if task is None:
+            task = pending[key] = asyncio.ensure_future(self._fetch_async(key))
+            task.add_done_callback(lambda done: _finish_inflight(pending, key, done))
+        return list(await asyncio.shield(task))
+
+    async def _fetch_async(self, key: Tuple[str, str, int]) -> List[NpiProvider]:
+        response = await _shared_async_client().get(
+            self.BASE_URL,
+            params=self._params(*key),
+            timeout=self._timeout,
+        )
+        response.raise_for_status()
+        return self._store(key, self._parse_providers(response.json()))
+
+    @staticmethod
+    def _cache_key(city: str, state: str, limit: int) -> Tuple[str, str, int]:
+        """Lookup arguments as the registry sees them (it ignores case)"""
+        return (" ".join(city.split()).upper(), state.strip().upper(), min(limit, 200))
+
+    @staticmethod
+    def _store(key: Tuple[str, str, int], providers: List[NpiProvider]) -> List[NpiProvider]:
+        with _lookup_lock:
+            _lookup_cache[key] = providers
+        return providers
+
+    @staticmethod
+    def _params(city: str, state: str, limit: int) -> Dict[str, Any]:
+        return {
             "version": "2.1",
             "city": city,
             "state": state,
-            "limit": min(limit, 200),
+            "limit": limit,
         }
 
-        response = self._client.get(self.BASE_URL, params=params)
-        response.raise_for_status()
-        payload = response.json()
-
+    @staticmethod
+    def _parse_providers(payload: Dict[str, Any]) -> List[NpiProvider]:
+        """Organization records (NPI-2) with a practice location, from a registry response"""
         providers: List[NpiProvider] = []
 
         for entry in payload.get("results", []):
@@ -112,3 +207,10 @@ class NpiClient:
 
         return providers
 
+
+
+def _finish_inflight(pending: Dict, key: Tuple[str, str, int], task: asyncio.Future) -> None:
+    """Forget a finished request; its failure was already raised to any waiters"""
+    pending.pop(key, None)
+    if not task.cancelled():
+        task.exception()
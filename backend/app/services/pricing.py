@@ -3,14 +3,19 @@ Pricing service containing business logic for cost estimates.
 """
 
 from datetime import date, datetime
-from typing import Optional, Union
+from functools import lru_cache
+from typing import Optional, Tuple, Union
 import hashlib
 import os
+import threading
+import weakref
 
-from sqlalchemy import func
+from cachetools import TTLCache
+from sqlalchemy import event, func
 from sqlalchemy.orm import Session
 
-from database import PriceTransparency, Procedure, Provider
+from database import PriceTransparency, PriceTransparencyAgg, Procedure, Provider, has_table
+from agents.procedure_index import get_procedure_index
 from .npi_client import NpiClient
 from .duckduckgo_search_client import DuckDuckGoSearchClient
 from .google_search_client import GoogleSearchClient
@@ -32,6 +37,21 @@ try:
 except ImportError:
     AGENT_AVAILABLE = False
 
+# Summary statistics (min, max, avg) per filter set, one cache per database engine.
+# Writes through the ORM clear them (see bottom of module); the TTL bounds
+# staleness for rows changed outside this process.
+SUMMARY_CACHE_SIZE = 4096
+SUMMARY_CACHE_TTL = 300
+
+_summary_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_summary_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _llm_client(api_key: str) -> "OpenRouterLLMClient":
+    """LLM client shared by every request, so its HTTP connections are reused"""
+    return OpenRouterLLMClient(api_key=api_key)
+
 
 class PricingService:
     """
@@ -56,7 +76,7 @@ class PricingService:
         if use_agent and AGENT_AVAILABLE:
             try:
                 api_key = os.getenv("OPENROUTER_API_KEY", "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")
-                llm_client = OpenRouterLLMClient(api_key=api_key)
+                llm_client = _llm_client(api_key)
                 self.agent = PricingEstimationAgent(
                     llm_client=llm_client,
                     search_client=self.search_client
@@ -80,22 +100,6 @@ class PricingService:
         """
         Fetch price transparency data filtered by the provided parameters.
         """
-        procedure = (
-            self.session.query(Procedure)
-            .filter(Procedure.cpt_code == cpt_code)
-            .first()
-        )
-        procedure_summary = (
-            ProcedureSummary.model_validate(procedure)
-            if procedure
-            else ProcedureSummary(
-                cpt_code=cpt_code,
-                description=f"Procedure {cpt_code}",
-                category=None,
-                medicare_rate=None,
-            )
-        )
-
         query = (
             self.session.query(
                 PriceTransparency,
@@ -158,7 +162,22 @@ class PricingService:
                 results=results,
             )
 
-        # No negotiated rate data found, attempt fallback via NPI
+        # No negotiated rate data found. The joined query above already carries the
+        # procedure row when there are prices, so it is only looked up here, in
+        # the in-memory procedure index.
+        procedure = get_procedure_index(self.session).get(cpt_code)
+        procedure_summary = (
+            ProcedureSummary.model_validate(procedure)
+            if procedure
+            else ProcedureSummary(
+                cpt_code=cpt_code,
+                description=f"Procedure {cpt_code}",
+                category=None,
+                medicare_rate=None,
+            )
+        )
+
+        # Attempt fallback via NPI
         fallback_results = self._fallback_with_npi(
             procedure_summary=procedure_summary,
             payer_name=payer_name,
@@ -215,6 +234,67 @@ class PricingService:
         """
         Compute summary statistics for the given filters.
         """
+        key = (cpt_code, payer_name, state.upper() if state else None, zip_code)
+        bind = self.session.get_bind()
+        with _summary_lock:
+            cache = _summary_caches.get(bind)
+            if cache is None:
+                cache = _summary_caches[bind] = TTLCache(
+                    maxsize=SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL
+                )
+            stats = cache.get(key)
+        
+        if stats is None:
+            stats = self._query_summary_stats(
+                cpt_code=cpt_code,
+                payer_name=payer_name,
+                state=state,
+                zip_code=zip_code,
+            )
+            with _summary_lock:
+                cache[key] = stats
+        
+        min_rate, max_rate, avg_rate = stats
+        
+        # A fresh model each time: callers fill in the per-request counts
+        return PricingSummary(
+            providers_count=0,
+            payer_matches=0,
+            min_rate=min_rate,
+            max_rate=max_rate,
+            average_rate=avg_rate,
+        )
+
+    def _query_summary_stats(
+        self,
+        *,
+        cpt_code: str,
+        payer_name: Optional[str],
+        state: Optional[str],
+        zip_code: Optional[str],
+    ) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        """
+        Run the (min, max, avg) negotiated-rate aggregate for the given filters.
+        
+        Unfiltered summaries come from price_transparency_agg when it has the
+        procedure; otherwise the aggregate runs over the price rows.
+        """
+        # A database file that predates the table lacks it until create_all() adds it
+        if not (payer_name or state or zip_code) and has_table(
+            self.session, PriceTransparencyAgg.__tablename__
+        ):
+            stored = (
+                self.session.query(
+                    PriceTransparencyAgg.min_negotiated,
+                    PriceTransparencyAgg.max_negotiated,
+                    PriceTransparencyAgg.avg_negotiated,
+                )
+                .filter(PriceTransparencyAgg.cpt_code == cpt_code)
+                .first()
+            )
+            if stored is not None:
+                return tuple(float(value) if value is not None else None for value in stored)
+
         stats_query = self.session.query(
             func.min(PriceTransparency.negotiated_rate),
             func.max(PriceTransparency.negotiated_rate),
@@ -237,12 +317,10 @@ class PricingService:
 
         min_rate, max_rate, avg_rate = stats_query.one()
 
-        return PricingSummary(
-            providers_count=0,
-            payer_matches=0,
-            min_rate=float(min_rate) if min_rate is not None else None,
-            max_rate=float(max_rate) if max_rate is not None else None,
-            average_rate=float(avg_rate) if avg_rate is not None else None,
+        return (
+            float(min_rate) if min_rate is not None else None,
+            float(max_rate) if max_rate is not None else None,
+            float(avg_rate) if avg_rate is not None else None,
         )
 
     def _fallback_with_npi(
@@ -525,3 +603,14 @@ class PricingService:
         """Deprecated: Use _fallback_with_web_search instead."""
         return self._fallback_with_web_search(**kwargs)
 
+
+def clear_summary_cache(*_args) -> None:
+    """Drop cached summary statistics; the next lookup queries the database"""
+    with _summary_lock:
+        _summary_caches.clear()
+
+
+# Summaries join prices to providers, so a change to either invalidates them
+for _model in (PriceTransparency, Provider):
+    for _event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event_name, clear_summary_cache)
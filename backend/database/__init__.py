@@ -9,8 +9,10 @@ from .schema import (
     Procedure,
     InsurancePlan,
     PriceTransparency,
+    PriceTransparencyAgg,
     FileProcessingLog,
-    QueryLog
+    QueryLog,
+    has_table,
 )
 
 # Create a global database manager instance for the application
@@ -24,8 +26,10 @@ __all__ = [
     'Procedure',
     'InsurancePlan',
     'PriceTransparency',
+    'PriceTransparencyAgg',
     'FileProcessingLog',
     'QueryLog',
+    'has_table',
     'DatabaseManager',
     'get_db_manager',
     'init_database',
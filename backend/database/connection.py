@@ -4,12 +4,27 @@ Supports both SQLite (dev) and PostgreSQL (production)
 """
 
 import os
-from sqlalchemy import create_engine
+from datetime import datetime
+from sqlalchemy import DateTime, create_engine, delete, func, insert, literal, select
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool, StaticPool
 from contextlib import contextmanager
 from typing import Generator
 
-from .schema import Base
+from .schema import Base, PriceTransparency, PriceTransparencyAgg, Provider
+
+# Connection pool for server databases, sized for concurrent search traffic.
+# Recycling bounds connection age below typical server/proxy idle timeouts.
+POOL_SIZE = 10
+MAX_OVERFLOW = 20
+POOL_RECYCLE_SECONDS = 300
+# A request that finds the pool exhausted fails after this long instead of hanging
+POOL_TIMEOUT_SECONDS = 30
+
+# Set when a server-side pooler (e.g. PgBouncer in transaction mode) owns the
+# connections: the engine then keeps none open and leaves pooling to it
+EXTERNAL_POOL = os.getenv("DATABASE_EXTERNAL_POOL", "").lower() in ("1", "true", "yes")
 
 
 class DatabaseManager:
@@ -34,10 +49,31 @@ class DatabaseManager:
             database_url = f"sqlite:///{db_path}"
         
         self.database_url = database_url
+        url = make_url(database_url)
+        if url.get_backend_name() == "sqlite":
+            # A local file can't drop the connection, so skip the per-checkout ping
+            pool_options = {}
+            if url.database in (None, "", ":memory:"):
+                # Each in-memory connection is its own empty database: share one
+                # across threads, so worker threads see the same tables
+                pool_options = {
+                    "poolclass": StaticPool,
+                    "connect_args": {"check_same_thread": False},
+                }
+        elif EXTERNAL_POOL:
+            pool_options = {"poolclass": NullPool}
+        else:
+            pool_options = {
+                "pool_size": POOL_SIZE,
+                "max_overflow": MAX_OVERFLOW,
+                "pool_timeout": POOL_TIMEOUT_SECONDS,
+                "pool_recycle": POOL_RECYCLE_SECONDS,
+                "pool_pre_ping": True,  # Verify connections before using
+            }
         self.engine = create_engine(
             database_url,
             echo=False,  # Set to True for SQL debugging
-            pool_pre_ping=True  # Verify connections before using
+            **pool_options
         )
         self.SessionLocal = sessionmaker(
             autocommit=False,
@@ -50,6 +86,41 @@ class DatabaseManager:
         Base.metadata.create_all(bind=self.engine)
         print(f"✓ Database tables created at: {self.database_url}")
     
+    def refresh_price_aggregates(self) -> int:
+        """
+        Rebuild price_transparency_agg from price_transparency in one transaction.
+        
+        Run after loading prices (DatabaseLoader does) or on a schedule.
+        
+        Returns:
+            Number of procedures with aggregates
+        """
+        agg = PriceTransparencyAgg.__table__
+        stats = (
+            select(
+                PriceTransparency.cpt_code,
+                func.avg(PriceTransparency.negotiated_rate),
+                func.avg(PriceTransparency.standard_charge),
+                func.min(PriceTransparency.negotiated_rate),
+                func.max(PriceTransparency.negotiated_rate),
+                func.count(),
+                literal(datetime.utcnow(), DateTime),
+            )
+            # Same rows as the live summary query, which joins providers
+            .join(Provider, PriceTransparency.provider_id == Provider.id)
+            .where(PriceTransparency.negotiated_rate.is_not(None))
+            .group_by(PriceTransparency.cpt_code)
+        )
+        
+        with self.engine.begin() as conn:
+            conn.execute(delete(agg))
+            conn.execute(insert(agg).from_select(
+                ["cpt_code", "avg_negotiated", "avg_standard", "min_negotiated",
+                 "max_negotiated", "record_count", "updated_at"],
+                stats,
+            ))
+            return conn.execute(select(func.count()).select_from(agg)).scalar_one()
+    
     def drop_tables(self):
         """Drop all tables (use with caution!)"""
         Base.metadata.drop_all(bind=self.engine)
@@ -3,11 +3,16 @@ Database schema for Healthcare Price Transparency Platform
 SQLAlchemy ORM models
 """
 
+import sys
+import weakref
+
 from sqlalchemy import (
-    Column, Integer, String, Text, Numeric, Boolean, Date, 
-    DateTime, ForeignKey, Index, JSON
+    Column, Integer, String, Text, Numeric, Float, Boolean, Date, 
+    DateTime, ForeignKey, Index, JSON, DDL, delete, event, inspect
 )
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session, relationship
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
 
 Base = declarative_base()
@@ -31,6 +36,18 @@ class Provider(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Provider listings filter by state and return rows by name, straight off
+    # idx_provider_state_name. City filters are ILIKE patterns, which only a
+    # trigram index can serve (PostgreSQL only).
+    __table_args__ = (
+        Index('idx_provider_state_name', 'state', 'name'),
+        Index(
+            'idx_provider_city_trgm', 'city',
+            postgresql_using='gin',
+            postgresql_ops={'city': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
+    
     def __repr__(self):
         return f"<Provider(id={self.id}, name='{self.name}', npi='{self.npi}')>"
 
@@ -45,10 +62,67 @@ class Procedure(Base):
     medicare_rate = Column(Numeric(10, 2))  # Baseline from CMS
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Trigram index for fuzzy description search (PostgreSQL only)
+    __table_args__ = (
+        Index(
+            'idx_procedure_desc_trgm', 'description',
+            postgresql_using='gin',
+            postgresql_ops={'description': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
+    
     def __repr__(self):
         return f"<Procedure(cpt_code='{self.cpt_code}', description='{self.description[:50]}...')>"
 
 
+# Before any table, since providers and procedures both have trigram indexes
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+# SQLite counterpart of the trigram index: an FTS5 shadow table over
+# procedures.description, kept in sync by triggers. Statements are idempotent
+# and hang off the metadata, so every create_all() also upgrades existing files.
+PROCEDURE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS procedures_fts USING fts5("
+    "description, content='procedures', content_rowid='rowid')",
+    "CREATE TRIGGER IF NOT EXISTS procedures_fts_ai AFTER INSERT ON procedures BEGIN "
+    "INSERT INTO procedures_fts(rowid, description) VALUES (new.rowid, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS procedures_fts_ad AFTER DELETE ON procedures BEGIN "
+    "INSERT INTO procedures_fts(procedures_fts, rowid, description) "
+    "VALUES ('delete', old.rowid, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS procedures_fts_au AFTER UPDATE ON procedures BEGIN "
+    "INSERT INTO procedures_fts(procedures_fts, rowid, description) "
+    "VALUES ('delete', old.rowid, old.description); "
+    "INSERT INTO procedures_fts(rowid, description) VALUES (new.rowid, new.description); END",
+    # Index rows that predate the triggers
+    "INSERT INTO procedures_fts(procedures_fts) VALUES ('rebuild')",
+)
+
+for _statement in PROCEDURE_FTS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+# Partial index over plain 5-digit CPT codes (not NDC/HCPCS), in the order the
+# procedure listing returns them. Also idempotent, so existing files get it too.
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS idx_procedure_cpt5 ON procedures (category IS NULL, cpt_code) "
+        "WHERE cpt_code GLOB '[0-9][0-9][0-9][0-9][0-9]'"
+    ).execute_if(dialect="sqlite")
+)
+
+
+@event.listens_for(Procedure, "load")
+def _intern_cpt_code(target, context):
+    """Intern loaded CPT codes so dict/set lookups on them compare by identity"""
+    if target.cpt_code is not None:
+        set_committed_value(target, "cpt_code", sys.intern(target.cpt_code))
+
+
 class InsurancePlan(Base):
     """Insurance plans and carriers"""
     __tablename__ = 'insurance_plans'
@@ -94,17 +168,93 @@ class PriceTransparency(Base):
     last_updated = Column(Date)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    # Indexes for fast lookups
+    # Read-only navigation for code that walks price rows; eager-load with
+    # selectinload() when iterating many rows, or each access is a query
+    provider = relationship("Provider", viewonly=True)
+    procedure = relationship("Procedure", viewonly=True)
+    
+    # Indexes for fast lookups. idx_cpt_rate also returns a code's rates already
+    # sorted, so cheapest-first listings and min/max need no sort step;
+    # idx_provider_payer does the same for a provider's prices by payer.
     __table_args__ = (
         Index('idx_lookup', 'provider_id', 'cpt_code', 'insurance_plan_id'),
         Index('idx_payer', 'payer_name'),
-        Index('idx_cpt', 'cpt_code'),
+        Index('idx_cpt_rate', 'cpt_code', 'negotiated_rate'),
+        Index('idx_provider_payer', 'provider_id', 'payer_name'),
     )
     
     def __repr__(self):
         return f"<PriceTransparency(id={self.id}, provider_id={self.provider_id}, cpt_code='{self.cpt_code}', rate={self.negotiated_rate})>"
 
 
+# create_all() skips indexes of tables that already exist, so existing databases
+# pick up the newer indexes here (a no-op where the table was just created with them)
+for _statement in (
+    "CREATE INDEX IF NOT EXISTS idx_cpt_rate ON price_transparency (cpt_code, negotiated_rate)",
+    "CREATE INDEX IF NOT EXISTS idx_provider_payer ON price_transparency (provider_id, payer_name)",
+    "CREATE INDEX IF NOT EXISTS idx_provider_state_name ON providers (state, name)",
+):
+    event.listen(Base.metadata, "after_create", DDL(_statement))
+
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS idx_provider_city_trgm ON providers USING gin (city gin_trgm_ops)"
+    ).execute_if(dialect="postgresql")
+)
+
+
+class PriceTransparencyAgg(Base):
+    """
+    Per-procedure rate statistics over price_transparency, precomputed so the
+    unfiltered price summary is a primary-key lookup. Rebuilt in full by
+    DatabaseManager.refresh_price_aggregates(); ORM writes to prices evict the
+    affected rows until the next refresh.
+    """
+    __tablename__ = 'price_transparency_agg'
+    
+    cpt_code = Column(String(10), primary_key=True)
+    avg_negotiated = Column(Float)
+    avg_standard = Column(Float)
+    min_negotiated = Column(Numeric(10, 2))
+    max_negotiated = Column(Numeric(10, 2))
+    record_count = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<PriceTransparencyAgg(cpt_code='{self.cpt_code}', records={self.record_count})>"
+
+
+@event.listens_for(Session, "after_flush")
+def _evict_price_aggs(session, flush_context):
+    """
+    Prices changed in this flush: evict their procedures' aggregates.
+    
+    One DELETE per flush, however many rows it wrote. Updates may move rows
+    between procedures, and a deleted provider drops its rows from the join,
+    so either evicts every aggregate. A file that predates the table has
+    nothing to evict.
+    """
+    agg = PriceTransparencyAgg.__table__
+    if any(isinstance(obj, Provider) for obj in session.deleted) or any(
+        isinstance(obj, PriceTransparency) and session.is_modified(obj) for obj in session.dirty
+    ):
+        eviction = delete(agg)
+    else:
+        cpt_codes = {
+            obj.cpt_code
+            for obj in (*session.new, *session.deleted)
+            if isinstance(obj, PriceTransparency)
+        }
+        if not cpt_codes:
+            return
+        eviction = delete(agg).where(agg.c.cpt_code.in_(cpt_codes))
+    
+    if has_table(session, agg.name):
+        session.connection().execute(eviction)
+
+
 class FileProcessingLog(Base):
     """Track processing of hospital transparency files"""
     __tablename__ = 'file_processing_log'
@@ -140,3 +290,23 @@ class QueryLog(Base):
     
     def __repr__(self):
         return f"<QueryLog(id={self.id}, query='{self.user_query[:50]}...')>"
+
+
+# Tables each engine's database was found to have (or lack), by name. Files
+# created before a schema upgrade may lack the newer tables until create_all()
+# runs, which resets the engine's entry.
+_table_presence: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def has_table(session, name: str) -> bool:
+    """Whether the session's database has table `name`, checked once per engine"""
+    bind = session.get_bind()
+    presence = _table_presence.setdefault(bind.engine, {})
+    if name not in presence:
+        presence[name] = inspect(session.connection()).has_table(name)
+    return presence[name]
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _reset_table_presence(target, connection, **kw):
+    _table_presence.pop(connection.engine, None)
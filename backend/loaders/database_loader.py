@@ -101,6 +101,10 @@ class DatabaseLoader:
                 logger.warning(f"Final commit failed: {e}")
                 session.rollback()
         
+        # Precomputed summaries for the new prices
+        if loaded_count:
+            self.db.refresh_price_aggregates()
+        
         logger.info(f"Successfully loaded {loaded_count} records")
         return loaded_count
     
@@ -13,6 +13,8 @@ from datetime import datetime
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from database.connection import DatabaseManager
+from sqlalchemy.orm import selectinload
+
 from database import Provider, Procedure, PriceTransparency
 from agents.adaptive_parser import AdaptiveParsingAgent
 from agents.openrouter_llm import OpenRouterLLMClient
@@ -150,7 +152,11 @@ def main():
     
     with db.session_scope() as session:
         # Get all price records
-        all_prices = session.query(PriceTransparency).all()
+        # Providers and procedures come in two batched queries, not two per row
+        all_prices = session.query(PriceTransparency).options(
+            selectinload(PriceTransparency.provider),
+            selectinload(PriceTransparency.procedure),
+        ).all()
         
         print(f"Exporting {len(all_prices):,} total records...")
         
@@ -169,8 +175,8 @@ def main():
             writer.writeheader()
             
             for price in all_prices:
-                provider = session.query(Provider).filter_by(id=price.provider_id).first()
-                procedure = session.query(Procedure).filter_by(cpt_code=price.cpt_code).first()
+                provider = price.provider
+                procedure = price.procedure
                 
                 writer.writerow({
                     'provider_id': price.provider_id,
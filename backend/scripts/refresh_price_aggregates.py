@@ -0,0 +1,31 @@
+"""
+Refresh Precomputed Price Aggregates
+Rebuilds price_transparency_agg from price_transparency; run nightly (e.g. from cron)
+or after loading prices outside DatabaseLoader
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.connection import init_database
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """Create missing tables, then rebuild the aggregates"""
+    db = init_database(drop_existing=False)
+    procedures = db.refresh_price_aggregates()
+    logger.info(f"✓ Refreshed price aggregates for {procedures} procedures")
+
+
+if __name__ == '__main__':
+    main()
@@ -142,6 +142,7 @@ def main():
     logger.info("=" * 80)
     
     with db.session_scope() as session:
+        from sqlalchemy.orm import selectinload
         from database import Provider, Procedure, PriceTransparency
         import csv
         
@@ -167,7 +168,9 @@ def main():
         output_path = Path(__file__).parent.parent.parent / 'freeman_parsed_results.csv'
         
         # Get all price records with joined data
-        all_prices = session.query(PriceTransparency).all()
+        all_prices = session.query(PriceTransparency).options(
+            selectinload(PriceTransparency.procedure)
+        ).all()
         
         with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
             fieldnames = [
@@ -187,10 +190,8 @@ def main():
             for price in all_prices:
                 # Get procedure description from Procedure table if available
                 procedure_desc = ''
-                if price.cpt_code:
-                    proc = session.query(Procedure).filter_by(cpt_code=price.cpt_code).first()
-                    if proc:
-                        procedure_desc = proc.description or ''
+                if price.procedure:
+                    procedure_desc = price.procedure.description or ''
                 
                 writer.writerow({
                     'cpt_code': price.cpt_code or '',
@@ -6,11 +6,12 @@ import pytest
 import json
 import os
 import tempfile
+from unittest.mock import Mock
 from pathlib import Path
 
 # Import components to test
 from database.connection import DatabaseManager, init_database
-from database import Provider, Procedure, InsurancePlan, PriceTransparency
+from database import Provider, Procedure, InsurancePlan, PriceTransparency, PriceTransparencyAgg
 from agents.adaptive_parser import AdaptiveParsingAgent
 from agents.openrouter_llm import OpenRouterLLMClient
 from loaders.database_loader import DatabaseLoader
@@ -84,6 +85,19 @@ class TestDatabase:
         assert test_db.engine is not None
         assert test_db.SessionLocal is not None
     
+    def test_memory_database_shared_across_threads(self, test_db):
+        """Test worker threads see the same in-memory database"""
+        import threading
+
+        with test_db.session_scope() as session:
+            session.add(Procedure(cpt_code="70553", description="MRI brain"))
+
+        counts = []
+        worker = threading.Thread(target=lambda: counts.append(test_db.get_session().query(Procedure).count()))
+        worker.start()
+        worker.join()
+        assert counts == [1]
+    
     def test_create_provider(self, test_db):
         """Test creating a provider"""
         with test_db.session_scope() as session:
@@ -135,6 +149,444 @@ class TestDatabase:
             assert price.id is not None
             assert price.negotiated_rate == 1250.00
 
+    def test_procedure_fts_tracks_descriptions(self, test_db):
+        """Test the FTS5 shadow table follows procedure inserts and updates"""
+        from agents.mock_llm import MockLLMClient
+        from agents.query_understanding_agent import QueryUnderstandingAgent
+
+        with test_db.session_scope() as session:
+            session.add(Procedure(cpt_code="73721", description="MRI knee without contrast"))
+            session.add(Procedure(cpt_code="71046", description="Chest x-ray, 2 views"))
+            session.flush()
+
+            agent = QueryUnderstandingAgent(llm_client=MockLLMClient(), db_session=session)
+            assert [row.cpt_code for row in agent._fts_candidates("knee mri", 10)] == ["73721"]
+            # Prefix terms match half-typed words
+            assert [row.cpt_code for row in agent._fts_candidates("ches", 10)] == ["71046"]
+
+            session.get(Procedure, "71046").description = "Chest radiograph"
+            session.flush()
+            assert agent._fts_candidates("x-ray", 10) == []
+            assert [m["cpt_code"] for m in agent._database_search("chest radiograph", 5)] == ["71046"]
+
+    def test_database_search_rejects_unrelated_descriptions(self, test_db):
+        """Test that rows sharing no words with the query never pass the match bar"""
+        from agents.mock_llm import MockLLMClient
+        from agents.query_understanding_agent import QueryUnderstandingAgent
+
+        with test_db.session_scope() as session:
+            session.add(Procedure(cpt_code="00409163010", description="ATROPINE 1MG ABBOJECT"))
+            session.add(Procedure(cpt_code="C1729", description="TUBE CHEST 32 FR STR HEPARIN"))
+            session.add(Procedure(cpt_code="73722", description="MRI-KNEE WITH CONTRAST RT"))
+            session.add(Procedure(cpt_code="L1833", description="ROAD RUNNER KNEE BRACE"))
+            session.flush()
+
+            agent = QueryUnderstandingAgent(llm_client=MockLLMClient(), db_session=session)
+
+            def good(query):
+                return [m["cpt_code"] for m in agent._database_search(query, 10) if m["match_score"] >= 0.5]
+
+            assert good("ct scan abdomen") == []
+            assert good("chest x-ray") == []
+            # The full match outranks the one-word match
+            assert good("knee mri") == ["73722", "L1833"]
+
+    def test_procedure_listing_search_uses_fts(self, test_db):
+        """Test listing search matches code prefixes and description phrase prefixes"""
+        from app.routers.procedures import list_procedures
+
+        with test_db.session_scope() as session:
+            session.add(Procedure(cpt_code="73721", description="MRI knee without contrast"))
+            session.add(Procedure(cpt_code="77071", description="X-RAY STRESS VIEW"))
+            session.flush()
+
+            def codes(q):
+                return [p.cpt_code for p in list_procedures(q=q, limit=10, db=session)]
+
+            assert codes("x-ray st") == ["77071"]
+            assert codes("mri kn") == ["73721"]
+            assert codes("7372") == ["73721"]
+            assert codes("mri contrast") == []
+
+    def test_search_without_fts_table_keeps_session_work(self, test_db):
+        """Test a file without procedures_fts falls back to ILIKE and keeps unflushed changes"""
+        from app.routers.procedures import list_procedures
+
+        # As in a file created before the FTS table and its triggers existed
+        with test_db.engine.begin() as conn:
+            for trigger in ("procedures_fts_ai", "procedures_fts_ad", "procedures_fts_au"):
+                conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+            conn.exec_driver_sql("DROP TABLE procedures_fts")
+
+        with test_db.session_scope() as session:
+            session.add(Procedure(cpt_code="73721", description="MRI knee without contrast"))
+            session.flush()
+            pending = Procedure(cpt_code="71046", description="Chest x-ray, 2 views")
+            session.add(pending)
+
+            assert [p.cpt_code for p in list_procedures(q="mri kn", limit=10, db=session)] == ["73721"]
+            assert pending in session
+            assert session.get(Procedure, "73721") is not None
+
+        # create_all() restores the table, and searches use it again
+        test_db.create_tables()
+        with test_db.session_scope() as session:
+            # ILIKE wouldn't match "x ray" against "x-ray"; the FTS tokenizer does
+            assert [p.cpt_code for p in list_procedures(q="x ray 2", limit=10, db=session)] == ["71046"]
+
+    def test_price_writes_without_agg_table(self, test_db):
+        """Test a file without price_transparency_agg still accepts ORM price writes"""
+        with test_db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP TABLE price_transparency_agg")
+
+        with test_db.session_scope() as session:
+            provider = Provider(npi="1234567890", name="Test Hospital", state="MO")
+            session.add(provider)
+            session.add(Procedure(cpt_code="70553", description="MRI brain"))
+            session.flush()
+            price = PriceTransparency(provider_id=provider.id, cpt_code="70553", negotiated_rate=1000.00)
+            session.add(price)
+            session.flush()
+
+            price.negotiated_rate = 1200.00
+            session.flush()
+            session.delete(price)
+            session.flush()
+            assert session.query(PriceTransparency).count() == 0
+
+    def test_cheapest_rates_read_from_index(self, test_db):
+        """Test cheapest-first price listings come off idx_cpt_rate without a sort"""
+        with test_db.engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT id FROM price_transparency "
+                "WHERE cpt_code = '70553' ORDER BY negotiated_rate LIMIT 20"
+            ).all()
+        details = " ".join(row[-1] for row in plan)
+        assert "idx_cpt_rate" in details
+        assert "TEMP B-TREE" not in details
+
+    def test_provider_prices_read_from_index(self, test_db):
+        """Test a provider's prices by payer come off idx_provider_payer without a sort"""
+        with test_db.engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT id FROM price_transparency "
+                "WHERE provider_id = 1 ORDER BY payer_name"
+            ).all()
+        details = " ".join(row[-1] for row in plan)
+        assert "idx_provider_payer" in details
+        assert "TEMP B-TREE" not in details
+
+    def test_provider_lookup_read_from_index(self, test_db):
+        """Test providers in a state come off idx_provider_state_name in name order"""
+        with test_db.engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT id FROM providers "
+                "WHERE state = 'MO' AND city LIKE 'jop%' ORDER BY name LIMIT 20"
+            ).all()
+        details = " ".join(row[-1] for row in plan)
+        assert "idx_provider_state_name" in details
+        assert "TEMP B-TREE" not in details
+
+    def test_price_summary_cached_until_prices_change(self, test_db):
+        """Test summary stats come from the cache until a price row is written"""
+        from sqlalchemy import insert
+        from app.services import PricingService
+
+        with test_db.session_scope() as session:
+            provider = Provider(npi="1234567890", name="Test Hospital", state="MO")
+            session.add(provider)
+            session.add(Procedure(cpt_code="70553", description="MRI brain"))
+            session.flush()
+            session.add(PriceTransparency(provider_id=provider.id, cpt_code="70553", negotiated_rate=1000.00))
+            session.flush()
+
+            service = PricingService(session, use_agent=False)
+            summary = service._calculate_summary(cpt_code="70553", payer_name=None, state="mo", zip_code=None)
+            assert summary.average_rate == 1000.0
+
+            # Core inserts skip the ORM events, so the cached answer stands
+            session.execute(insert(PriceTransparency).values(
+                provider_id=provider.id, cpt_code="70553", negotiated_rate=2000.00
+            ))
+            summary = service._calculate_summary(cpt_code="70553", payer_name=None, state="MO", zip_code=None)
+            assert summary.average_rate == 1000.0
+
+            session.add(PriceTransparency(provider_id=provider.id, cpt_code="70553", negotiated_rate=3000.00))
+            session.flush()
+            summary = service._calculate_summary(cpt_code="70553", payer_name=None, state="MO", zip_code=None)
+            assert summary.average_rate == 2000.0
+            assert summary.max_rate == 3000.0
+
+    def test_price_rows_eager_load_provider_and_procedure(self, test_db):
+        """Test walking price rows with selectinload costs a fixed number of queries"""
+        from sqlalchemy import event
+        from sqlalchemy.orm import selectinload
+
+        with test_db.session_scope() as session:
+            providers = [Provider(npi=f"100000000{i}", name=f"Hospital {i}") for i in range(3)]
+            session.add_all(providers)
+            session.add_all([Procedure(cpt_code=code, description=f"Procedure {code}") for code in ("70553", "73721")])
+            session.flush()
+            session.add_all([
+                PriceTransparency(provider_id=provider.id, cpt_code=code, negotiated_rate=100.0)
+                for provider in providers for code in ("70553", "73721")
+            ])
+
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        event.listen(test_db.engine, "before_cursor_execute", record)
+        try:
+            with test_db.session_scope() as session:
+                prices = session.query(PriceTransparency).options(
+                    selectinload(PriceTransparency.provider),
+                    selectinload(PriceTransparency.procedure),
+                ).all()
+                rows = {(price.provider.name, price.procedure.description) for price in prices}
+        finally:
+            event.remove(test_db.engine, "before_cursor_execute", record)
+
+        assert len(rows) == 6
+        assert len(statements) == 3
+
+    def test_provider_prices_fetched_in_one_query(self, test_db, monkeypatch):
+        """Test that a provider's prices and its existence check share one streamed query"""
+        import asyncio
+        from fastapi import HTTPException
+        from sqlalchemy import event
+        from app.routers import providers
+        from app.routers.providers import get_provider_prices
+
+        # One row per batch, so the array is stitched together across batches
+        monkeypatch.setattr(providers, "PRICE_STREAM_BATCH_SIZE", 1)
+
+        with test_db.session_scope() as session:
+            priced = Provider(npi="1234567890", name="Priced Hospital")
+            unpriced = Provider(npi="1234567891", name="New Clinic")
+            session.add_all([priced, unpriced, Procedure(cpt_code="70553", description="MRI brain")])
+            session.flush()
+            session.add_all([
+                PriceTransparency(provider_id=priced.id, cpt_code="70553", payer_name="Cigna", negotiated_rate=900.0),
+                PriceTransparency(provider_id=priced.id, cpt_code="70553", payer_name="Aetna", negotiated_rate=800.0),
+                PriceTransparency(provider_id=priced.id, cpt_code="99999", payer_name="Aetna", negotiated_rate=50.0),
+            ])
+            priced_id, unpriced_id = priced.id, unpriced.id
+
+        async def read_body(response):
+            return b"".join([chunk async for chunk in response.body_iterator])
+
+        def read_prices(session, provider_id):
+            response = get_provider_prices(provider_id, db=session)
+            return json.loads(asyncio.run(read_body(response)))
+
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        with test_db.session_scope() as session:
+            event.listen(test_db.engine, "before_cursor_execute", record)
+            try:
+                items = read_prices(session, priced_id)
+            finally:
+                event.remove(test_db.engine, "before_cursor_execute", record)
+
+            assert [(item["price"]["payer_name"], item["procedure"]["cpt_code"]) for item in items] == [
+                ("Aetna", "70553"), ("Cigna", "70553")
+            ]
+            assert items[0]["provider"]["name"] == "Priced Hospital"
+            assert len(statements) == 1
+
+            assert read_prices(session, unpriced_id) == []
+            with pytest.raises(HTTPException):
+                get_provider_prices(unpriced_id + 100, db=session)
+
+    def test_provider_responses_cached_until_providers_change(self, test_db):
+        """Test provider listings are served from cache until a provider is written"""
+        from sqlalchemy import event
+        from app.routers.providers import clear_provider_cache, get_provider, list_providers
+
+        clear_provider_cache()
+        with test_db.session_scope() as session:
+            provider = Provider(npi="1234567890", name="Test Hospital", state="MO")
+            session.add(provider)
+            session.flush()
+            provider_id = provider.id
+
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        with test_db.session_scope() as session:
+            event.listen(test_db.engine, "before_cursor_execute", record)
+            try:
+                first = list_providers(state="mo", limit=100, offset=0, db=session)
+                second = list_providers(state="MO", limit=100, offset=0, db=session)
+                by_id = [get_provider(provider_id, db=session) for _ in range(2)]
+            finally:
+                event.remove(test_db.engine, "before_cursor_execute", record)
+
+        assert first.body == second.body
+        assert [p["name"] for p in json.loads(first.body)] == ["Test Hospital"]
+        assert json.loads(by_id[1].body)["npi"] == "1234567890"
+        assert len(statements) == 2
+
+        with test_db.session_scope() as session:
+            session.add(Provider(npi="1234567891", name="Another Hospital", state="MO"))
+
+        with test_db.session_scope() as session:
+            refreshed = list_providers(state="MO", limit=100, offset=0, db=session)
+            second_page = list_providers(state="MO", limit=1, offset=1, db=session)
+        assert [p["name"] for p in json.loads(refreshed.body)] == ["Another Hospital", "Test Hospital"]
+        assert [p["name"] for p in json.loads(second_page.body)] == ["Test Hospital"]
+
+    def test_provider_lookup_supplemented_from_npi_registry(self, test_db, monkeypatch):
+        """Test that lookups top up local providers from the async NPI client"""
+        import asyncio
+        import httpx
+        from app.routers.providers import lookup_providers
+        from app.services import npi_client
+
+        def location(npi, name):
+            return {
+                "number": npi,
+                "enumeration_type": "NPI-2",
+                "basic": {"organization_name": name},
+                "addresses": [{"address_purpose": "LOCATION", "address_1": "1 Main St", "city": "JOPLIN", "state": "MO"}],
+            }
+
+        registry_requests = []
+
+        def handler(request):
+            registry_requests.append(request.url.params)
+            return httpx.Response(200, json={"results": [
+                location("1234567890", "Test Hospital"),
+                location("1234567899", "Registry Clinic"),
+            ]})
+
+        npi_client._lookup_cache.clear()
+        with test_db.session_scope() as session:
+            session.add(Provider(npi="1234567890", name="Test Hospital", city="Joplin", state="MO"))
+
+        async def lookup(session, limit):
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+                monkeypatch.setattr(npi_client, "_shared_async_client", lambda: http)
+                return await lookup_providers(city="Joplin", state="mo", limit=limit, db=session)
+
+        with test_db.session_scope() as session:
+            summaries = asyncio.run(lookup(session, 5))
+            local_only = asyncio.run(lookup(session, 1))
+
+        assert [(s.name, s.id is None) for s in summaries] == [
+            ("Test Hospital", False), ("Registry Clinic", True)
+        ]
+        assert registry_requests[0]["state"] == "MO"
+        # The database filled the limit, so the speculative registry request is dropped
+        assert [s.name for s in local_only] == ["Test Hospital"]
+
+    def test_npi_lookups_cached_and_coalesced(self, monkeypatch):
+        """Test concurrent identical NPI lookups share one request and repeats hit the cache"""
+        import asyncio
+        import httpx
+        from app.services import NpiClient, npi_client
+
+        registry_requests = []
+
+        async def handler(request):
+            registry_requests.append(request.url.params)
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={"results": []})
+
+        async def lookups():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+                monkeypatch.setattr(npi_client, "_shared_async_client", lambda: http)
+                client = NpiClient()
+                await asyncio.gather(
+                    client.lookup_async(city="Joplin", state="mo"),
+                    client.lookup_async(city=" joplin ", state="MO"),
+                )
+                await client.lookup_async(city="JOPLIN", state="MO")
+
+        npi_client._lookup_cache.clear()
+        asyncio.run(lookups())
+        assert len(registry_requests) == 1
+        assert registry_requests[0]["city"] == "JOPLIN"
+
+    def test_price_summary_reads_refreshed_aggregates(self, test_db):
+        """Test unfiltered summaries come from price_transparency_agg until prices change"""
+        from sqlalchemy import insert
+        from app.services import PricingService
+        from app.services.pricing import clear_summary_cache
+
+        with test_db.session_scope() as session:
+            provider = Provider(npi="1234567890", name="Test Hospital", state="MO")
+            session.add(provider)
+            session.add(Procedure(cpt_code="70553", description="MRI brain"))
+            session.flush()
+            session.add_all([
+                PriceTransparency(provider_id=provider.id, cpt_code="70553", negotiated_rate=rate, standard_charge=4000.00)
+                for rate in (1000.00, 2000.00)
+            ])
+            provider_id = provider.id
+
+        assert test_db.refresh_price_aggregates() == 1
+
+        with test_db.session_scope() as session:
+            agg = session.get(PriceTransparencyAgg, "70553")
+            assert (agg.record_count, agg.avg_negotiated, agg.avg_standard) == (2, 1500.0, 4000.0)
+
+            # Core inserts bypass the ORM, so the stored aggregate answers
+            session.execute(insert(PriceTransparency).values(
+                provider_id=provider_id, cpt_code="70553", negotiated_rate=6000.00
+            ))
+            clear_summary_cache()
+            service = PricingService(session, use_agent=False)
+            summary = service._calculate_summary(cpt_code="70553", payer_name=None, state=None, zip_code=None)
+            assert (summary.min_rate, summary.max_rate, summary.average_rate) == (1000.0, 2000.0, 1500.0)
+
+            # An ORM write evicts the row, and the summary is recomputed from prices
+            session.add(PriceTransparency(provider_id=provider_id, cpt_code="70553", negotiated_rate=3000.00))
+            session.flush()
+            assert session.get(PriceTransparencyAgg, "70553", populate_existing=True) is None
+            summary = service._calculate_summary(cpt_code="70553", payer_name=None, state=None, zip_code=None)
+            assert summary.average_rate == 3000.0
+
+    def test_price_inserts_evict_aggregates_once_per_flush(self, test_db):
+        """Test a flush of many price rows evicts their aggregates in one statement"""
+        from sqlalchemy import event
+
+        with test_db.session_scope() as session:
+            provider = Provider(npi="1234567890", name="Test Hospital", state="MO")
+            session.add(provider)
+            session.flush()
+            provider_id = provider.id
+            for code in ("70553", "73721", "71046"):
+                session.add(Procedure(cpt_code=code, description=f"Procedure {code}"))
+                session.add(PriceTransparency(provider_id=provider_id, cpt_code=code, negotiated_rate=1000.00))
+
+        assert test_db.refresh_price_aggregates() == 3
+
+        evictions = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("DELETE FROM price_transparency_agg"):
+                evictions.append(statement)
+
+        event.listen(test_db.engine, "before_cursor_execute", record)
+        try:
+            with test_db.session_scope() as session:
+                session.add_all([
+                    PriceTransparency(provider_id=provider_id, cpt_code=code, negotiated_rate=rate)
+                    for code in ("70553", "73721")
+                    for rate in (500.00, 1500.00, 2500.00)
+                ])
+                session.flush()
+                assert len(evictions) == 1
+                assert session.get(PriceTransparencyAgg, "70553", populate_existing=True) is None
+                assert session.get(PriceTransparencyAgg, "73721", populate_existing=True) is None
+                assert session.get(PriceTransparencyAgg, "71046", populate_existing=True) is not None
+
+                # A flush that writes no prices evicts nothing
+                session.add(Procedure(cpt_code="99213", description="Office visit"))
+                session.flush()
+                assert len(evictions) == 1
+        finally:
+            event.remove(test_db.engine, "before_cursor_execute", record)
+
 
 # Adaptive Parser Tests
 
@@ -426,8 +878,186 @@ class TestDataValidator:
         assert 0 < report['valid_rate'] < 1
 
 
+# Pricing Estimation Agent Tests
+
+class TestPricingEstimationAgent:
+    """Test web/LLM price estimation"""
+    
+    def test_estimates_cached_by_request_inputs(self):
+        """Test a repeated estimate skips the web search and LLM call"""
+        from agents.pricing_estimation_agent import PricingEstimationAgent
+        from app.services.duckduckgo_search_client import SearchResult
+        
+        search_client = Mock()
+        search_client.search_cpt_pricing.return_value = [
+            SearchResult(title="MRI cost", url="https://a.example", snippet="", extracted_prices=[1000.0, 1200.0]),
+            SearchResult(title="MRI price", url="https://b.example", snippet="", extracted_prices=[1100.0]),
+        ]
+        llm = Mock()
+        llm.complete.return_value = '{"analysis": "Typical regional pricing"}'
+        PricingEstimationAgent._estimate_cache.clear()
+        
+        agent = PricingEstimationAgent(llm_client=llm, search_client=search_client)
+        first = agent.estimate_price(cpt_code="70553", state="mo", city="Joplin")
+        second = agent.estimate_price(cpt_code="70553", state="MO", city=" joplin ")
+        
+        assert second == first
+        assert first["analysis"] == "Typical regional pricing"
+        assert search_client.search_cpt_pricing.call_count == 1
+        assert llm.complete.call_count == 1
+        
+        agent.estimate_price(cpt_code="70553", state="KS", city="Joplin")
+        assert search_client.search_cpt_pricing.call_count == 2
+        PricingEstimationAgent._estimate_cache.clear()
+
+
 # Integration Tests
 
+class TestOpenRouterClient:
+    """Test OpenRouter request construction"""
+    
+    def test_system_prompt_marked_for_prompt_caching(self):
+        """Test that the shared system prompt is sent as a cacheable prefix"""
+        client = OpenRouterLLMClient(api_key="test-key", model="anthropic/claude-3.5-sonnet")
+        payload = client._payload("User query: \"knee\"", 0.1, 256, None, system="Instructions")
+        
+        system, user = payload["messages"]
+        assert system["content"] == [
+            {"type": "text", "text": "Instructions", "cache_control": {"type": "ephemeral"}}
+        ]
+        assert user == {"role": "user", "content": "User query: \"knee\""}
+        
+        openai = OpenRouterLLMClient(api_key="test-key", model="openai/gpt-4-turbo")
+        assert "cache_control" not in openai._payload("q", 0.1, 256, None, system="Instructions")["messages"][0]["content"][0]
+
+    def test_stream_never_mixes_partial_text_with_fallback(self):
+        """Test that a stream failing mid-way raises, and one failing up front falls back"""
+        import requests
+
+        class FakeResponse:
+            def __init__(self, lines):
+                self.lines = lines
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def raise_for_status(self):
+                pass
+
+            def iter_lines(self, decode_unicode=False):
+                for line in self.lines:
+                    if isinstance(line, Exception):
+                        raise line
+                    yield line
+
+        def stream(*lines):
+            client = OpenRouterLLMClient(api_key="test-key")
+            session = Mock()
+            session.post.return_value = FakeResponse(lines)
+            client._session = lambda: session
+            client._mock_response = lambda prompt, system=None: "FALLBACK"
+            return client.stream("User query: \"knee\"")
+
+        content = 'data: {"choices": [{"delta": {"content": "{\\"cpt_codes\\": ["}}]}'
+        broken = stream(content, requests.exceptions.ChunkedEncodingError("connection reset"))
+        assert next(broken) == '{"cpt_codes": ['
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            next(broken)
+
+        assert list(stream('data: {"error": {"message": "overloaded"}}')) == ["FALLBACK"]
+        assert list(stream("data: not json")) == ["FALLBACK"]
+        # Events without choices (e.g. a trailing usage event) carry no text
+        assert list(stream(content, 'data: {"usage": {"total_tokens": 5}}', "data: [DONE]")) == ['{"cpt_codes": [']
+
+    def test_async_stream_stops_after_json_value(self):
+        """Test that the query agent streams over the async client and stops at the closing bracket"""
+        import asyncio
+        import httpx
+        from agents.query_understanding_agent import QueryUnderstandingAgent
+
+        events = [
+            {"choices": [{"delta": {"content": '{"cpt_codes": ["737'}}]},
+            {"choices": [{"delta": {"content": '21"]}'}}]},
+            {"choices": [{"delta": {"content": " trailing tokens"}}]},
+        ]
+        body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(json.loads(request.content))
+            return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+        async def suggest():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+                llm = OpenRouterLLMClient(api_key="test-key", http_client=http)
+                agent = QueryUnderstandingAgent(llm, Mock())
+                return await agent._complete_async("User query: \"knee\"", system="Instructions")
+
+        assert asyncio.run(suggest()) == '{"cpt_codes": ["73721"]}'
+        assert requests_seen[0]["stream"] is True
+        assert requests_seen[0]["messages"][0]["role"] == "system"
+
+    def test_async_stream_never_mixes_partial_text_with_fallback(self):
+        """Test that stream_async raises mid-stream failures and falls back on up-front ones"""
+        import asyncio
+        import httpx
+
+        content = 'data: {"choices": [{"delta": {"content": "{\\"cpt_codes\\": ["}}]}\n\n'
+
+        class BrokenBody(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                yield content.encode()
+                raise httpx.RemoteProtocolError("connection reset")
+
+        async def collect(response):
+            async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: response)) as http:
+                llm = OpenRouterLLMClient(api_key="test-key", http_client=http)
+                llm._mock_response = lambda prompt, system=None: "FALLBACK"
+                seen = []
+                try:
+                    async for chunk in llm.stream_async("User query: \"knee\""):
+                        seen.append(chunk)
+                except httpx.HTTPError as e:
+                    seen.append(type(e))
+                return seen
+
+        assert asyncio.run(collect(httpx.Response(200, stream=BrokenBody()))) == [
+            '{"cpt_codes": [', httpx.RemoteProtocolError
+        ]
+        error_event = httpx.Response(200, text='data: {"error": {"message": "overloaded"}}\n\n')
+        assert asyncio.run(collect(error_event)) == ["FALLBACK"]
+
+
+class TestETagMiddleware:
+    """Test conditional GETs"""
+    
+    def test_unchanged_response_answered_with_304(self):
+        """Test that a matching If-None-Match gets an empty 304"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from app.middleware import ETagMiddleware
+        
+        api = FastAPI()
+        api.add_middleware(ETagMiddleware)
+        
+        @api.get("/rates")
+        def rates():
+            return {"cpt_code": "73721", "rates": [1200.0, 1450.0]}
+        
+        client = TestClient(api)
+        first = client.get("/rates")
+        etag = first.headers["etag"]
+        
+        assert etag.startswith('W/"')
+        repeat = client.get("/rates", headers={"If-None-Match": etag})
+        assert repeat.status_code == 304
+        assert repeat.content == b""
+        assert client.get("/rates", headers={"If-None-Match": 'W/"stale"'}).json() == first.json()
+
+
 class TestIntegration:
     """Integration tests for complete pipeline"""
     
@@ -2,12 +2,26 @@
 Tests for Query Understanding Agent with web search fallback
 """
 
+import asyncio
+import json
+import sys
+import time
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-from agents.query_understanding_agent import QueryUnderstandingAgent
+from agents.query_understanding_agent import QueryUnderstandingAgent, _read_json_value, _SERP_CACHE
+from agents.procedure_index import ProcedureIndex, ProcedureRecord
+from agents.hot_queries import build_hot_query_map, normalize_query
 from database.schema import Procedure
 
 
+@pytest.fixture(autouse=True)
+def clear_agent_caches():
+    """Keep answers cached by one test from leaking into the next"""
+    QueryUnderstandingAgent.cache_clear()
+    QueryUnderstandingAgent._llm_codes_cache.clear()
+    yield
+
+
 # Mock database session
 @pytest.fixture
 def mock_db():
@@ -86,9 +100,9 @@ class TestQueryUnderstandingAgent:
         mock_query = Mock()
         # First call (sample procedures)
         mock_query.limit.return_value.all.return_value = mock_procedures
-        # Second call (filter by CPT code)
+        # Second call (filter by CPT codes)
         mock_filter_query = Mock()
-        mock_filter_query.first.return_value = mock_procedures[0]
+        mock_filter_query.all.return_value = [mock_procedures[0]]
         mock_query.filter.return_value = mock_filter_query
         
         mock_db.query.return_value = mock_query
@@ -104,6 +118,433 @@ class TestQueryUnderstandingAgent:
         # Assert
         assert len(results) > 0
         assert results[0]["cpt_code"] == "70553"
+
+    def test_llm_answer_reused_for_paraphrases(self, mock_db, mock_llm, mock_procedures):
+        """Test that reordered, pluralized or misspelled queries skip the LLM"""
+        mock_query = Mock()
+        mock_query.limit.return_value.all.return_value = mock_procedures
+        mock_query.filter.return_value.all.return_value = [mock_procedures[0]]
+        mock_db.query.return_value = mock_query
+        mock_llm.complete.return_value = '["70553"]'
+
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+
+        for query in ["brain MRI with contrast", "MRIs of the brain with contrast", "brain MRI with contrst"]:
+            assert [r["cpt_code"] for r in agent._llm_enhanced_search(query, limit=5)] == ["70553"]
+        assert mock_llm.complete.call_count == 1
+
+        agent._llm_enhanced_search("knee MRI", limit=5)
+        assert mock_llm.complete.call_count == 2
+
+    def test_llm_answer_not_reused_across_qualifiers(self, mock_db, mock_llm, mock_procedures):
+        """Test that near-identical queries differing in negation or side call the LLM again"""
+        mock_query = Mock()
+        mock_query.limit.return_value.all.return_value = mock_procedures
+        mock_query.filter.return_value.all.return_value = [mock_procedures[0]]
+        mock_db.query.return_value = mock_query
+        mock_llm.complete.return_value = '["70553"]'
+
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+
+        pairs = [
+            ("CT angiography abdominal aorta iliofemoral lower extremity runoff with contrast",
+             "CT angiography abdominal aorta iliofemoral lower extremity runoff without contrast"),
+            ("ultrasound duplex scan lower extremity arteries complete left",
+             "ultrasound duplex scan lower extremity arteries complete rt"),
+        ]
+        for cached, query in pairs:
+            agent._llm_enhanced_search(cached, limit=5)
+            calls = mock_llm.complete.call_count
+            agent._llm_enhanced_search(query, limit=5)
+            assert mock_llm.complete.call_count == calls + 1
+
+    @patch('agents.query_understanding_agent.LLM_RETRY_BACKOFF', 0)
+    def test_llm_timeout_retries_then_falls_back(self, mock_db, mock_llm, mock_procedures):
+        """Test that a stalled LLM is retried once and then abandoned"""
+        mock_query = Mock()
+        mock_query.limit.return_value.all.return_value = mock_procedures
+        mock_db.query.return_value = mock_query
+        mock_llm.complete.side_effect = lambda *args, **kwargs: time.sleep(0.5) or '["70553"]'
+        
+        agent = QueryUnderstandingAgent(mock_llm, mock_db, request_timeout=0.05)
+        
+        results = agent._llm_enhanced_search("brain MRI", limit=5)
+        
+        assert results == []
+        assert mock_llm.complete.call_count == 2
+    
+    def test_llm_timeout_passed_to_http_request(self, mock_db):
+        """Test that clients taking a timeout get the agent's, so abandoned calls end"""
+        class TimedClient:
+            supports_timeout = True
+
+            def __init__(self):
+                self.timeouts = []
+
+            def complete(self, prompt, timeout=None, **kwargs):
+                self.timeouts.append(timeout)
+                return '{"cpt_codes": []}'
+
+        llm = TimedClient()
+        agent = QueryUnderstandingAgent(llm, mock_db, request_timeout=3.0)
+
+        assert agent._complete("User query: \"knee\"", temperature=0.1) == '{"cpt_codes": []}'
+        assert agent._complete("User query: \"knee\"", timeout=1.5) == '{"cpt_codes": []}'
+        assert llm.timeouts == [3.0, 1.5]
+
+    def test_streamed_json_abandoned_after_deadline(self):
+        """Test that a stream trickling past its deadline is closed, not read to the end"""
+        consumed = []
+
+        def chunks():
+            while True:
+                consumed.append(1)
+                yield '{"cpt_codes": ["7'
+
+        with pytest.raises(TimeoutError):
+            _read_json_value(chunks(), deadline=time.monotonic() - 1)
+        assert len(consumed) == 1
+
+    def test_prompt_context_built_once(self, mock_db, mock_llm, mock_procedures):
+        """Test that the procedure sample for the prompt is fetched once per engine"""
+        mock_query = Mock()
+        mock_db.query.return_value = mock_query
+        mock_query.limit.return_value.all.return_value = mock_procedures
+        
+        first_system, first = QueryUnderstandingAgent(mock_llm, mock_db)._build_llm_search_prompt("knee")
+        second_system, second = QueryUnderstandingAgent(mock_llm, mock_db)._build_llm_search_prompt("brain")
+        
+        assert "73721: MRI, Lower Extremity" in first_system
+        assert "70553: MRI, Brain" in second_system
+        # The shared prefix is byte-identical; only the user message varies
+        assert first_system is second_system
+        assert first == 'User query: "knee"'
+        mock_query.limit.assert_called_once_with(30)
+    
+    def test_resolve_cpt_codes_keeps_llm_ranking(self, mock_db, mock_llm, mock_procedures):
+        """Test that codes are fetched in one query and keep the LLM's order"""
+        mock_query = Mock()
+        mock_query.filter.return_value.all.return_value = mock_procedures
+        mock_db.query.return_value = mock_query
+        
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        
+        results = agent._resolve_cpt_codes(["73721", "99999", "70553"], 0.8)
+        
+        assert [r["cpt_code"] for r in results] == ["73721", "70553"]
+        assert mock_query.filter.call_count == 1
+    
+    def test_async_search_prefers_database(self, mock_db, mock_llm, mock_procedures):
+        """Test that strong DB matches win over the concurrent LLM call"""
+        mock_query = Mock()
+        mock_query.filter.return_value.limit.return_value.all.return_value = mock_procedures
+        mock_query.limit.return_value.all.return_value = mock_procedures
+        mock_db.query.return_value = mock_query
+        
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        
+        results = asyncio.run(agent.search_procedures_async("MRI", limit=5))
+        
+        assert [r["cpt_code"] for r in results] == ["70553", "73721"]
+    
+    def test_async_search_uses_llm_when_database_empty(self, mock_db, mock_llm, mock_procedures):
+        """Test that LLM suggestions are used when the DB search finds nothing"""
+        mock_query = Mock()
+        mock_query.filter.return_value.limit.return_value.all.return_value = []
+        mock_query.filter.return_value.all.return_value = [mock_procedures[0]]
+        mock_query.limit.return_value.all.return_value = mock_procedures
+        mock_query.all.return_value = []  # Nothing in the word index either
+        mock_db.query.return_value = mock_query
+        mock_llm.complete.return_value = '["70553"]'
+        
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        
+        results = asyncio.run(agent.search_procedures_async("head scan", limit=5))
+        
+        assert len(results) == 1
+        assert results[0]["cpt_code"] == "70553"
+        assert results[0]["match_score"] == 0.8
+    
+    def test_concurrent_llm_requests_share_one_call(self, mock_db, mock_llm):
+        """Test that LLM suggestions requested together go out as one batched prompt"""
+        mock_llm.complete.return_value = json.dumps({"results": [
+            {"query": 2, "cpt_codes": ["70553"]},
+            {"query": 1, "cpt_codes": ["73721", "bad"]},
+        ]})
+        
+        async def suggest_both():
+            return await asyncio.gather(
+                QueryUnderstandingAgent(mock_llm, mock_db)._batched_llm_codes("knee scan", "ctx"),
+                QueryUnderstandingAgent(mock_llm, mock_db)._batched_llm_codes("head scan", "ctx"),
+            )
+        
+        assert asyncio.run(suggest_both()) == [["73721"], ["70553"]]
+        mock_llm.complete.assert_called_once()
+        prompt = mock_llm.complete.call_args[0][0]
+        assert prompt == 'User queries:\n1. "knee scan"\n2. "head scan"'
+        assert '"results"' in mock_llm.complete.call_args.kwargs["system"]
+    
+    def test_procedure_index_matches_reordered_words(self):
+        """Test that the word index ignores word order and punctuation"""
+        index = ProcedureIndex([
+            ProcedureRecord("73721", "MRI, Lower Extremity Joint (knee) without Contrast", "Radiology", 1400.0),
+            ProcedureRecord("45378", "Colonoscopy", "Gastroenterology", 3200.0),
+        ])
+        
+        hits = index.search("knee MRI", limit=5)
+        
+        assert len(hits) == 1
+        record, score = hits[0]
+        assert record.cpt_code == "73721"
+        assert score == 1.0
+        assert index.search("of the", limit=5) == []
+
+    def test_procedure_index_breaks_ties_by_row_order(self):
+        """Test that equal scores at the cut-off keep the earliest rows"""
+        index = ProcedureIndex(
+            [ProcedureRecord(str(70000 + i), f"MRI scan {i}", "Radiology", None) for i in range(50)]
+            + [ProcedureRecord("73721", "MRI knee", "Radiology", None)]
+        )
+
+        hits = index.search("knee MRI", limit=3)
+
+        assert [record.cpt_code for record, _ in hits] == ["73721", "70000", "70001"]
+        assert [score for _, score in hits] == [1.0, 0.5, 0.5]
+
+    def test_database_search_uses_trigram_index_on_postgres(self, mock_db, mock_llm, mock_procedures):
+        """Test that PostgreSQL candidates come from pg_trgm word similarity and score as on SQLite"""
+        from sqlalchemy.dialects import postgresql
+        
+        mock_db.get_bind.return_value.dialect.name = "postgresql"
+        mock_query = Mock()
+        mock_db.query.return_value = mock_query
+        colonoscopy = Mock(spec=Procedure)
+        colonoscopy.cpt_code = "45378"
+        colonoscopy.description = (
+            "Colonoscopy, flexible; diagnostic, including collection of specimen(s) "
+            "by brushing or washing, when performed (separate procedure)"
+        )
+        colonoscopy.category = "Gastroenterology"
+        colonoscopy.medicare_rate = 400.0
+        mock_query.filter.return_value.order_by.return_value.limit.return_value.all.return_value = [
+            colonoscopy, mock_procedures[1],
+        ]
+        
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        results = agent._database_search("colonoscopy", limit=5)
+        
+        # A short query against a long description: matched by the best stretch of it
+        (condition,), _ = mock_query.filter.call_args
+        (ordering,), _ = mock_query.filter.return_value.order_by.call_args
+        assert "<%" in str(condition.compile(dialect=postgresql.dialect()))
+        assert "<<->" in str(ordering.compile(dialect=postgresql.dialect()))
+        mock_query.filter.return_value.order_by.return_value.limit.assert_called_once_with(25)
+        
+        # Scored in Python on the usual scale; the unrelated row falls away
+        assert [(r["cpt_code"], r["match_score"]) for r in results] == [("45378", 1.0)]
+        
+        mock_query.filter.return_value.order_by.return_value.limit.return_value.all.return_value = [
+            mock_procedures[1],
+        ]
+        results = agent._database_search("lower extremity mri scan", limit=5)
+        assert [(r["cpt_code"], r["match_score"]) for r in results] == [("73721", 0.75)]
+
+    def test_repeated_query_served_from_result_cache(self, mock_db, mock_llm, mock_procedures):
+        """Test that a retyped query skips the database until procedures change"""
+        mock_query = Mock()
+        mock_query.filter.return_value.limit.return_value.all.return_value = mock_procedures
+        mock_db.query.return_value = mock_query
+
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        first = agent.search_procedures("MRI contrast", limit=5)
+        second = agent.search_procedures("  mri CONTRAST ", limit=5)
+
+        assert second == first
+        assert mock_db.query.call_count == 1
+
+        QueryUnderstandingAgent.cache_clear()
+        agent.search_procedures("MRI contrast", limit=5)
+        assert mock_db.query.call_count == 2
+
+    @patch('agents.query_understanding_agent.DUCKDUCKGO_AVAILABLE', True)
+    def test_no_web_request_when_database_answers(self, mock_db, mock_llm, mock_procedures):
+        """Test that a query the database answers sends nothing to DuckDuckGo"""
+        mock_query = Mock()
+        mock_query.filter.return_value.limit.return_value.all.return_value = mock_procedures
+        mock_query.limit.return_value.all.return_value = mock_procedures
+        mock_db.query.return_value = mock_query
+        
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        
+        with patch.object(agent, '_duckduckgo_fetch') as fetch:
+            agent.search_procedures("MRI", limit=5)
+            asyncio.run(agent.search_procedures_async("MRI", limit=3))
+        
+        fetch.assert_not_called()
+
+    @patch('agents.query_understanding_agent.DUCKDUCKGO_AVAILABLE', True)
+    def test_web_fetched_once_when_database_empty(self, mock_db, mock_llm):
+        """Test that the DuckDuckGo fetch runs once the local tiers have missed"""
+        mock_query = Mock()
+        mock_db.query.return_value = mock_query
+        mock_query.filter.return_value.limit.return_value.all.return_value = []
+        mock_query.filter.return_value.all.return_value = []
+        mock_llm.complete.return_value = '{"procedures": [{"cpt_code": "12345", "description": "Test procedure"}]}'
+        
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        agent._query_cache.clear()
+        
+        with patch.object(agent, '_index_search', return_value=[]), \
+             patch.object(agent, '_duckduckgo_fetch', return_value=(["12345"], ["snippet"])) as fetch:
+            results = agent.search_procedures("unusual procedure", limit=5)
+        
+        assert [r["cpt_code"] for r in results] == ["12345"]
+        fetch.assert_called_once_with("unusual procedure")
+        agent._query_cache.clear()
+
+    def test_token_bucket_paces_requests_beyond_burst(self):
+        """Test that the shared limiter allows a burst, then paces at its rate"""
+        from agents.query_understanding_agent import _TokenBucket
+
+        bucket = _TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+
+        # Two tokens up front, the next two at 1/20 s each
+        assert 0.09 <= time.monotonic() - start < 0.5
+
+    def test_concurrent_web_searches_for_same_query_run_once(self, mock_db, mock_llm):
+        """Test that duplicate in-flight queries share one (empty) web search"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        agent._query_cache.clear()
+
+        def slow_fallback(*args):
+            time.sleep(0.1)
+            return []
+
+        with patch.object(agent, '_web_search_fallback', side_effect=slow_fallback) as fallback:
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(
+                    lambda q: agent._cached_web_search(q, 5),
+                    ["misspeled procedure", "Misspeled Procedure ", "misspeled procedure", "misspeled procedure"],
+                ))
+            # The empty answer is cached as well
+            assert agent._cached_web_search("misspeled procedure", 5) == []
+
+        assert results == [[], [], [], []]
+        assert fallback.call_count == 1
+        assert agent._web_search_locks == {}
+        agent._query_cache.clear()
+    
+    def test_duckduckgo_fetch_ranks_codes_by_context(self, mock_db, mock_llm):
+        """Test that one search is made and codes are ranked by nearby text"""
+        fake_ddgs = Mock()
+        fake_ddgs.DDGS.return_value.text.return_value = [
+            {"title": "Billing guide", "body": "Colonoscopy is billed as 45378 in most plans."},
+            {"title": "Imaging codes", "body": "For an MRI of the knee use CPT 73721 without contrast."},
+        ]
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        _SERP_CACHE.clear()
+        
+        with patch.dict(sys.modules, {"ddgs": fake_ddgs}):
+            codes, snippets = agent._duckduckgo_fetch("knee mri")
+            # Same search string in different case: served from the response cache
+            assert agent._duckduckgo_fetch("Knee MRI")[0] == ["73721"]
+        
+        assert codes == ["73721"]
+        assert len(snippets) == 2
+        fake_ddgs.DDGS.return_value.text.assert_called_once()
+        _SERP_CACHE.clear()
+    
+    def test_hot_query_skips_database_and_llm(self, mock_db, mock_llm):
+        """Test that common queries resolve from the pre-registered map"""
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        index = ProcedureIndex([
+            ProcedureRecord("73721", "MRI, lower extremity, without contrast", "Imaging", 1400.0),
+        ])
+        
+        with patch('agents.query_understanding_agent.get_procedure_index', return_value=index):
+            results = agent.search_procedures("MRI of the Knee", limit=5)
+        
+        assert [r["cpt_code"] for r in results] == ["73721"]
+        assert results[0]["match_score"] == 0.99
+        mock_db.query.assert_not_called()
+        mock_llm.complete.assert_not_called()
+    
+    def test_named_codes_and_price_questions_skip_llm(self, mock_db, mock_llm):
+        """Test that queries naming a code or asking a price resolve without the LLM"""
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        index = ProcedureIndex([
+            ProcedureRecord("73721", "MRI, lower extremity, without contrast", "Imaging", 1400.0),
+            ProcedureRecord("99213", "Office visit, established patient", "E&M", 90.0),
+        ])
+        
+        with patch('agents.query_understanding_agent.get_procedure_index', return_value=index):
+            by_code = agent.search_procedures("CPT 99213 near 10001", limit=5)
+            by_question = agent.search_procedures("How much does a knee MRI cost?", limit=5)
+        
+        assert [(r["cpt_code"], r["match_score"]) for r in by_code] == [("99213", 1.0)]
+        assert [(r["cpt_code"], r["match_score"]) for r in by_question] == [("73721", 0.99)]
+        mock_db.query.assert_not_called()
+        mock_llm.complete.assert_not_called()
+    
+    def test_hot_query_file_extends_builtin_phrases(self, tmp_path):
+        """Test that phrases from the hot query file are added to the built-in map"""
+        path = tmp_path / "hot_queries.json"
+        path.write_text('{"Sleep Tests": ["95810"], "knee MRI": ["73722"]}')
+        
+        hot_map = build_hot_query_map(str(path))
+        
+        assert hot_map[normalize_query("sleep test")] == ("95810",)
+        assert hot_map[normalize_query("knee mri")] == ("73722",)
+        assert hot_map[normalize_query("chest ct")] == ("71250", "71260")
+        assert build_hot_query_map(str(tmp_path / "missing.json")) == build_hot_query_map()
+    
+    def test_llm_search_requests_structured_output(self, mock_db, mock_llm, mock_procedures):
+        """Test that the LLM is asked for schema-constrained JSON"""
+        mock_query = Mock()
+        mock_db.query.return_value = mock_query
+        mock_query.limit.return_value.all.return_value = mock_procedures
+        mock_query.filter.return_value.all.return_value = [mock_procedures[0]]
+        mock_llm.complete.return_value = '{"cpt_codes": ["70553"]}'
+        
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        results = agent._llm_enhanced_search("brain scan", limit=5)
+        
+        assert [r["cpt_code"] for r in results] == ["70553"]
+        response_format = mock_llm.complete.call_args.kwargs["response_format"]
+        assert response_format["type"] == "json_schema"
+    
+    def test_streamed_json_stops_at_closing_brace(self):
+        """Test that streaming stops reading once the JSON value is complete"""
+        consumed = []
+        
+        def chunks():
+            for chunk in ['{"cpt_codes": ', '["70553", ', '"7]3721"]}', ' trailing', ' tokens']:
+                consumed.append(chunk)
+                yield chunk
+        
+        result = _read_json_value(chunks())
+        
+        assert result == '{"cpt_codes": ["70553", "7]3721"]}'
+        assert len(consumed) == 3
+    
+    def test_procedure_index_finds_descriptions_inside_query(self):
+        """Test that a whole description contained in a longer query is found"""
+        pytest.importorskip("ahocorasick")
+        index = ProcedureIndex([
+            ProcedureRecord("45378", "Colonoscopy", "Gastroenterology", 3200.0),
+            ProcedureRecord("45380", "Colonoscopy with Biopsy", "Gastroenterology", 3600.0),
+            ProcedureRecord("80061", "Lipid Panel", "Laboratory", 40.0),
+        ])
+        
+        hits = index.phrase_search("how much is a colonoscopy with biopsy", limit=5)
+        
+        assert [r.cpt_code for r in hits] == ["45380", "45378"]
+        assert index.phrase_search("panel lipid", limit=5) == []
     
     def test_cpt_code_parsing(self, mock_db, mock_llm):
         """Test CPT code extraction from LLM responses"""
@@ -113,9 +554,15 @@ class TestQueryUnderstandingAgent:
         result = agent._parse_cpt_codes('["12345", "67890"]')
         assert result == ["12345", "67890"]
         
-        # Test with markdown code block
+        # Test with the structured-output object
+        result = agent._parse_cpt_codes('{"cpt_codes": ["12345"]}')
+        assert result == ["12345"]
+        
+        # Test with markdown code block (clients that ignore response_format)
         result = agent._parse_cpt_codes('```json\n["12345"]\n```')
         assert result == ["12345"]
+        result = agent._parse_cpt_codes('Codes:\n```\n{"cpt_codes": ["12345"]}\n```')
+        assert result == ["12345"]
         
         # Test with invalid codes (should filter out non-5-digit)
         result = agent._parse_cpt_codes('["123", "12345"]')
@@ -140,6 +587,13 @@ class TestQueryUnderstandingAgent:
         # No match
         score = agent._calculate_match_score("MRI", "Colonoscopy")
         assert score < 0.5
+        
+        # Shared letters or a single shared word don't make a match
+        assert agent._calculate_match_score("ct scan abdomen", "ATROPINE 1MG ABBOJECT") < 0.5
+        assert agent._calculate_match_score("chest x-ray", "TUBE CHEST 32 FR STR HEPARIN") < 0.5
+        
+        # Words joined by punctuation still count
+        assert agent._calculate_match_score("knee mri", "MRI-KNEE WITH CONTRAST RT") == 1.0
     
     @patch('agents.query_understanding_agent.DUCKDUCKGO_AVAILABLE', True)
     @patch('duckduckgo_search.DDGS')
@@ -208,6 +662,28 @@ class TestQueryUnderstandingAgent:
         assert result[0] == ("12345", "Test Procedure A")
         assert result[1] == ("67890", "Test Procedure B")
     
+    def test_llm_validation_cached_per_query_and_codes(self, mock_db, mock_llm):
+        """Test that the same query and code set reuse the earlier LLM verdict"""
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        agent._validation_cache.clear()
+        mock_llm.complete.return_value = '{"procedures": [{"cpt_code": "73721", "description": "Knee MRI"}]}'
+        
+        first = agent._validate_cpts_with_llm("knee mri", ["73721", "73722"], [])
+        second = agent._validate_cpts_with_llm("Knee MRI", ["73722", "73721"], [])
+        
+        assert first == second == [("73721", "Knee MRI")]
+        assert mock_llm.complete.call_count == 1
+        agent._validation_cache.clear()
+    
+    def test_llm_validation_skipped_for_single_code(self, mock_db, mock_llm):
+        """Test that a lone web-search code is returned without an LLM call"""
+        agent = QueryUnderstandingAgent(mock_llm, mock_db)
+        
+        result = agent._validate_cpts_with_llm("knee mri", ["73721"], ["Context snippet"])
+        
+        assert result == [("73721", "Knee Mri (CPT 73721)")]
+        mock_llm.complete.assert_not_called()
+    
     def test_merge_results_deduplication(self, mock_db, mock_llm):
         """Test that merge properly deduplicates results"""
         agent = QueryUnderstandingAgent(mock_llm, mock_db)